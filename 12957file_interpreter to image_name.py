@@ -1,7 +1,10 @@
 import os
-from scipy.io import loadmat
 from datetime import datetime, timedelta
 
+from irccam_index import FrameIndex, nearest_key
+from irccam_reader import list_image_keys, load_image
+from remote_cache import read_remote_cache_config
+
 # Function to calculate the dynamic image key based on a given time
 def generate_dynamic_key(current_time):
     # Extract hour, minute, and second from the time
@@ -13,80 +16,85 @@ def generate_dynamic_key(current_time):
     key = f"img_{hour}{minute}{second}"
     return key
 
-# Function to load and extract the appropriate image data from the MAT file
+# Function to load and extract the appropriate image data from the MAT file.
+# Only the key index and the single requested image variable are read.
 def process_file(file_path, target_time):
     print(f"Lade die Datei: {file_path}")
     
     try:
-        # Load the MAT file
-        mat_data = loadmat(file_path)
+        # Read only the variable names of the MAT file
+        available_keys = list_image_keys(file_path)
         
         # Generate the dynamic image key based on the target time
         dynamic_key = generate_dynamic_key(target_time)
         print(f"Dynamischer Schlüssel: {dynamic_key}")
         
         # Check if the exact key exists
-        if dynamic_key not in mat_data:
+        if dynamic_key not in available_keys:
             print(f"Schlüssel {dynamic_key} nicht gefunden, Suche nach nächstem verfügbaren Schlüssel.")
-            available_keys = [key for key in mat_data.keys() if key.startswith('img_')]
             
             if available_keys:
-                # Use the highest available key if the exact match is not found
-                closest_key = max(available_keys)
+                # Use the key closest in time if the exact match is not found;
+                # without a timestamp in the file name fall back to the latest key
+                closest_key = nearest_key(os.path.basename(file_path), available_keys, target_time)
+                if closest_key is None:
+                    closest_key = max(available_keys)
                 print(f"Bilddaten für Schlüssel {closest_key} geladen.")
-                image_data = mat_data[closest_key]['image'][0, 0]
+                image_data = load_image(file_path, closest_key)
                 return image_data
             else:
                 print("Kein passender Schlüssel in der Datei gefunden.")
                 return None
         else:
             print(f"Bilddaten für Schlüssel {dynamic_key} geladen.")
-            image_data = mat_data[dynamic_key]['image'][0, 0]
+            image_data = load_image(file_path, dynamic_key)
             return image_data
         
     except Exception as e:
         print(f"Fehler beim Laden der Datei {file_path}: {e}")
         return None
 
-# Function to analyze data for the last 'n' hours with a buffer for delay
-def analyze_last_n_hours(directory, hours_to_analyze, delay_in_minutes=60):
+# Function to analyze data for the last 'n' hours with a buffer for delay.
+# Frames are looked up in the persistent archive index instead of probing file names.
+# With a remote cache, each hourly file is copied once and repeated runs read the local copy.
+def analyze_last_n_hours(directory, hours_to_analyze, delay_in_minutes=60, index=None, cache=None):
     # Get the current time
     current_time = datetime.now()
+
+    # Bring the archive index up to date with a single directory scan
+    own_index = index is None
+    if own_index:
+        index = FrameIndex()
+    index.update(directory)
     
-    # Iterate over the last 'n' hours
-    for i in range(hours_to_analyze):
-        # Calculate the time for the current iteration (subtract 'i' hours from the current time)
-        target_time = current_time - timedelta(hours=i)
-        
-        # Create the file name based on the target time (in the format YYYYMMDDHH00)
-        file_name = f"irccam_{target_time.strftime('%Y%m%d%H00')}.12957"
-        file_path = os.path.join(directory, file_name)
-        
-        # Check if the file exists (allow for a delay in upload)
-        if os.path.exists(file_path):
-            # Process the file and attempt to extract the image data
-            image_data = process_file(file_path, target_time)
+    try:
+        # Iterate over the last 'n' hours
+        for i in range(hours_to_analyze):
+            # Calculate the time for the current iteration (subtract 'i' hours from the current time)
+            target_time = current_time - timedelta(hours=i)
             
-            if image_data is not None:
-                print(f"Bild erfolgreich für {target_time} geladen.")
-            else:
-                print(f"Kein Bild für {target_time} geladen.")
-        else:
-            # Add a buffer to account for delay in file upload
-            delayed_time = target_time - timedelta(minutes=delay_in_minutes)
-            file_name_delayed = f"irccam_{delayed_time.strftime('%Y%m%d%H00')}.12957"
-            file_path_delayed = os.path.join(directory, file_name_delayed)
+            # Closest frame within the upload delay buffer
+            frame = index.nearest(target_time, max_distance=timedelta(minutes=delay_in_minutes))
+            if frame is None:
+                print(f"Kein Bild innerhalb von {delay_in_minutes} Minuten um {target_time} gefunden.")
+                continue
+
+            frame_time, file_path, key = frame
+            print(f"Lade die Datei: {file_path} ({key})")
+            try:
+                local_path = cache.fetch(file_path) if cache is not None else file_path
+                image_data = load_image(local_path, key)
+            except Exception as e:
+                print(f"Fehler beim Laden der Datei {file_path}: {e}")
+                image_data = None
             
-            if os.path.exists(file_path_delayed):
-                # Process the delayed file
-                image_data = process_file(file_path_delayed, delayed_time)
-                
-                if image_data is not None:
-                    print(f"Bild erfolgreich für verzögerten Zeitpunkt {delayed_time} geladen.")
-                else:
-                    print(f"Kein Bild für {delayed_time} geladen.")
+            if image_data is not None:
+                print(f"Bild erfolgreich für {frame_time} geladen.")
             else:
-                print(f"Datei {file_name} und auch verzögerte Datei {file_name_delayed} nicht gefunden.")
+                print(f"Kein Bild für {frame_time} geladen.")
+    finally:
+        if own_index:
+            index.close()
 
 # Main Program
 if __name__ == "__main__":
@@ -99,5 +107,12 @@ if __name__ == "__main__":
     # Delay in minutes to account for upload delays (e.g., 60 minutes)
     delay_in_minutes = 60
     
+    # Optional local cache for the network share ([remote_cache] section in config.ini)
+    cache = read_remote_cache_config("config.ini")
+    
     # Analyze the images for the last 'n' hours with a delay buffer
-    analyze_last_n_hours(directory_2024, hours_to_analyze, delay_in_minutes)
+    try:
+        analyze_last_n_hours(directory_2024, hours_to_analyze, delay_in_minutes, cache=cache)
+    finally:
+        if cache is not None:
+            cache.close()
@@ -0,0 +1,137 @@
+import argparse
+import csv
+import sys
+from collections import namedtuple
+from datetime import datetime, timedelta
+
+from database import get_connection
+
+# Zeitliche Zusammenführung von AOD, Wind und Wolken für die Go/No-Go-Entscheidung.
+# Die drei Reihen haben unterschiedliche Zeitstempel (AOD aus Stundenbruchteilen,
+# Wind aus HHMM, IRCCAM aus Dateiname + Schlüssel). Für jede Minute eines Bereichs
+# wird per As-of-Join der letzte Wert jeder Reihe innerhalb einer Toleranz gesucht.
+# Alle Eingaben sind zeitlich sortiert, der Join läuft daher in linearer Zeit.
+
+DEFAULT_TOLERANCES = {
+    'aod': timedelta(minutes=15),
+    'wind': timedelta(minutes=5),
+    'cloud': timedelta(minutes=15),
+}
+
+AlignedRow = namedtuple('AlignedRow', [
+    'date_time', 'aod', 'aod_flag', 'windspeed', 'winddirection', 'wind_flag',
+    'cloud_flag', 'cloud_distance', 'combined_flag',
+])
+
+# Indizierte Bereichsabfragen (date_time sollte indiziert sein, siehe README)
+RANGE_QUERIES = {
+    'aod': "SELECT date_time, aod, aod_flag FROM aod_measurements "
+           "WHERE date_time BETWEEN %s AND %s ORDER BY date_time",
+    'wind': "SELECT date_time, windspeed, winddirection, wind_flag FROM wind_measurements "
+            "WHERE date_time BETWEEN %s AND %s ORDER BY date_time",
+    'cloud': "SELECT date_time, cloud_flag, cloud_distance FROM ancillary.image_irccam "
+             "WHERE date_time BETWEEN %s AND %s ORDER BY date_time",
+}
+
+
+# Minutenraster von start (auf die Minute abgerundet) bis end
+def minute_grid(start, end):
+    current = start.replace(second=0, microsecond=0)
+    step = timedelta(minutes=1)
+    while current <= end:
+        yield current
+        current += step
+
+
+# As-of-Zeiger über eine sortierte Reihe von Tupeln (Zeitstempel, ...).
+# at(t) liefert den letzten Eintrag mit Zeitstempel <= t, sofern er höchstens
+# tolerance alt ist; die Zeitpunkte t müssen aufsteigend abgefragt werden.
+class AsOfCursor:
+    def __init__(self, rows, tolerance):
+        self._rows = iter(rows)
+        self._tolerance = tolerance
+        self._current = None
+        self._next = next(self._rows, None)
+
+    def at(self, timestamp):
+        while self._next is not None and self._next[0] <= timestamp:
+            self._current = self._next
+            self._next = next(self._rows, None)
+        if self._current is None or timestamp - self._current[0] > self._tolerance:
+            return None
+        return self._current
+
+
+# Gesamtflag: ein Fehler oder Flag eines Sensors sperrt die Kalibrierung, fehlende Daten ebenso
+def combined_flag(*flags):
+    if 'error' in flags:
+        return 'error'
+    if 'flag' in flags:
+        return 'flag'
+    if None in flags:
+        return 'missing'
+    return 'ok'
+
+
+# Minutenweise Zusammenführung im Speicher.
+#   aod_rows:   (date_time, aod, aod_flag, ...)             z.B. aus read_aod_data
+#   wind_rows:  (date_time, windspeed, winddirection, wind_flag, ...)  z.B. aus read_wind_data
+#   cloud_rows: (date_time, cloud_flag, cloud_distance)
+# Alle Reihen müssen nach date_time sortiert sein; Ergebnis ist ein Generator von AlignedRow.
+def align(start, end, aod_rows, wind_rows, cloud_rows, tolerances=None):
+    tolerances = dict(DEFAULT_TOLERANCES, **(tolerances or {}))
+    aod = AsOfCursor(aod_rows, tolerances['aod'])
+    wind = AsOfCursor(wind_rows, tolerances['wind'])
+    cloud = AsOfCursor(cloud_rows, tolerances['cloud'])
+
+    for minute in minute_grid(start, end):
+        aod_row = aod.at(minute)
+        wind_row = wind.at(minute)
+        cloud_row = cloud.at(minute)
+
+        aod_value, aod_flag = (aod_row[1], aod_row[2]) if aod_row else (None, None)
+        windspeed, winddirection, wind_flag = (wind_row[1], wind_row[2], wind_row[3]) if wind_row else (None, None, None)
+        if cloud_row:
+            cloud_flag = 'flag' if cloud_row[1] else 'ok'
+            cloud_distance = cloud_row[2]
+        else:
+            cloud_flag = cloud_distance = None
+
+        yield AlignedRow(
+            minute, aod_value, aod_flag, windspeed, winddirection, wind_flag,
+            cloud_flag, cloud_distance, combined_flag(aod_flag, wind_flag, cloud_flag),
+        )
+
+
+# Datenbankgestützte Variante: eine indizierte Bereichsabfrage pro Tabelle
+# (statt einer Abfrage pro Zeitpunkt), danach derselbe lineare Join
+def align_from_database(start, end, config_file='config.ini', tolerances=None):
+    tolerances = dict(DEFAULT_TOLERANCES, **(tolerances or {}))
+    series = {}
+    with get_connection(config_file) as connection:
+        cursor = connection.cursor()
+        try:
+            for name, query in RANGE_QUERIES.items():
+                # Etwas früher beginnen, damit der erste Rasterpunkt einen Vorgänger hat
+                cursor.execute(query, (start - tolerances[name], end))
+                series[name] = cursor.fetchall()
+        finally:
+            cursor.close()
+
+    return list(align(start, end, series['aod'], series['wind'], series['cloud'], tolerances))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='AOD, Wind und Wolken minutenweise zusammenführen (CSV-Ausgabe)')
+    parser.add_argument('--start', required=True, type=datetime.fromisoformat, help='Beginn, z.B. 2024-08-01')
+    parser.add_argument('--end', required=True, type=datetime.fromisoformat, help='Ende, z.B. 2024-08-31T23:59')
+    parser.add_argument('--config', default='config.ini')
+    args = parser.parse_args(argv)
+
+    writer = csv.writer(sys.stdout)
+    writer.writerow(AlignedRow._fields)
+    writer.writerows(align_from_database(args.start, args.end, args.config))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,55 +1,54 @@
-import mysql.connector
-import configparser
 from datetime import datetime, timedelta
+import io
 import os
 import logging
 import re
+import numpy as np
+import argparse
+import queue
+import threading
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
 
-# Protokollierung einrichten
-logging.basicConfig(filename='aod_data.log', level=logging.DEBUG, 
-                    format='%(asctime)s:%(levelname)s:%(message)s')
+from database import CONFIG_FILE, transaction
+from flag_rules import get_engine
+from ingest_manifest import DEFAULT_MANIFEST, IngestManifest, read_complete_lines
+from remote_cache import read_remote_cache_config
+from metrics import TRACE_SAMPLE_EVERY, collect, count, export, merge_collected, stage, timed, trace_enabled
 
-# Hinzufügen eines StreamHandlers, um Logs im Terminal auszugeben
-console_handler = logging.StreamHandler()
-console_handler.setLevel(logging.DEBUG)
-console_handler.setFormatter(logging.Formatter('%(asctime)s:%(levelname)s:%(message)s'))
-logging.getLogger('').addHandler(console_handler)
+# Protokollierung einrichten (nur beim Aufruf als Skript, nicht beim Import,
+# z.B. durch watch_daemon)
+def setup_logging():
+    logging.basicConfig(filename='aod_data.log', level=logging.DEBUG, 
+                        format='%(asctime)s:%(levelname)s:%(message)s')
 
-# Funktion zum Lesen der Konfigurationsdatei
-def read_db_config(filename='config.ini', section='mysql'):
-    parser = configparser.ConfigParser()
-    parser.read(filename)
-    
-    db = {}
-    if parser.has_section(section):
-        items = parser.items(section)
-        for item in items:
-            db[item[0]] = item[1]
-    else:
-        raise Exception(f'{section} not found in the {filename} file')
-    
-    return db
+    # Hinzufügen eines StreamHandlers, um Logs im Terminal auszugeben
+    console_handler = logging.StreamHandler()
+    console_handler.setLevel(logging.DEBUG)
+    console_handler.setFormatter(logging.Formatter('%(asctime)s:%(levelname)s:%(message)s'))
+    logging.getLogger('').addHandler(console_handler)
 
-# Funktion zum Einlesen der AOD-Daten mit Regex
-def read_aod_data(file_path):
-    aod_data = []
-    filename = os.path.basename(file_path)
-    
-    with open(file_path, 'r') as file:
-        lines = file.readlines()
-        
-    # Datum extrahieren
-    date_line = lines[6]  # '%DATE =2024-08-29\n'
-    current_date = date_line.split('=')[1].strip()
-    current_date = datetime.strptime(current_date, '%Y-%m-%d').date()
+AOD_DATE_LINE = 6      # '%DATE =2024-08-29\n'
+AOD_HEADER_LINES = 21  # Die tatsächlichen Datenzeilen beginnen nach Zeile 21
 
-    data_lines = lines[21:]  # Die tatsächlichen Datenzeilen beginnen nach Zeile 21
+# Regex zur Extraktion der Daten
+AOD_DATA_PATTERN = re.compile(r'\s*(\d+\.\d+)\s+(\d+\.\d+)\s+(\d+\.\d+)\s+(\d+\.\d+)\s+(\d+\.\d+)\s+(\d+\.\d+)\s+(\d+\.\d+)\s+(\d+\.\d+)\s+(\d+)')
 
-    # Regex zur Extraktion der Daten
-    data_pattern = re.compile(r'\s*(\d+\.\d+)\s+(\d+\.\d+)\s+(\d+\.\d+)\s+(\d+\.\d+)\s+(\d+\.\d+)\s+(\d+\.\d+)\s+(\d+\.\d+)\s+(\d+\.\d+)\s+(\d+)')
+# Datum aus der Kopfzeile extrahieren
+def parse_aod_date(date_line):
+    current_date = date_line.split('=')[1].strip()
+    return datetime.strptime(current_date, '%Y-%m-%d').date()
+
+# Funktion zum Auswerten der Datenzeilen.
+# Die Flags kommen aus den Regeln in config.ini (flag_rules); stream führt die
+# gleitenden Fenster über mehrere Aufrufe weiter, sonst beginnt jeder Aufruf neu.
+def parse_aod_lines(data_lines, current_date, filename, first_line_number=AOD_HEADER_LINES + 1, stream=None):
+    aod_data = []
+    stream = stream or get_engine().stream()
+    # Debugausgabe nur stichprobenweise und erst formatieren, wenn sie ausgegeben wird
+    trace = trace_enabled()
 
-    for line_number, line in enumerate(data_lines, start=22):
-        match = data_pattern.match(line)
+    for line_number, line in enumerate(data_lines, start=first_line_number):
+        match = AOD_DATA_PATTERN.match(line)
         if match:
             try:
                 time_in_hours = float(match.group(1))
@@ -59,65 +58,203 @@ def read_aod_data(file_path):
                 
                 aod = float(match.group(5))  # Annahme: Spalte 5 (Index 4) ist AOD-Wert bei 500.4 nm
 
-                if aod < 0:
-                    aod_flag = 'error'
-                elif aod > 0.12:
-                    aod_flag = 'flag'
-                else:
-                    aod_flag = 'ok'
+                aod_flag = stream.flag('aod', datetime_value, aod)
 
                 aod_data.append((datetime_value, aod, aod_flag, filename))
-                logging.debug(f"Datensatz hinzugefügt: {datetime_value}, AOD: {aod}, Flag: {aod_flag}")
+                if trace and len(aod_data) % TRACE_SAMPLE_EVERY == 1:
+                    logging.debug("Datensatz hinzugefügt: %s, AOD: %s, Flag: %s", datetime_value, aod, aod_flag)
             except Exception as e:
                 logging.error(f"Fehler in Zeile {line_number}: {e}")
 
+    count('aod_rows_parsed', len(aod_data))
+    count('aod_rows_invalid', len(data_lines) - len(aod_data))
+    return aod_data
+
+# Strukturierter Datentyp für den spaltenweisen Parser
+AOD_DTYPE = np.dtype([('date_time', 'datetime64[m]'), ('aod', 'f8'), ('aod_flag', 'U5')])
+# Zeichen, aus denen eine reguläre Datenzeile besteht (Ziffern, Punkt, Leerraum)
+AOD_CHARACTERS = b'0123456789. \t\r\n'
+# Zeichenklassen für die Formatprüfung: Ziffern -> '0', Leerraum -> ' '
+AOD_CLASSES = bytes.maketrans(b'123456789\t\r', b'000000000  ')
+
+# Zeilen wie beim Lesen im Textmodus (\n, \r\n und \r als Zeilenende)
+def _text_lines(data):
+    return io.TextIOWrapper(io.BytesIO(data), encoding='utf-8', errors='replace').readlines()
+
+# Formatprüfung für den ganzen Block: True, wenn jede nicht leere Zeile auf AOD_DATA_PATTERN passt.
+# Das Muster hängt nur von der Zeichenklasse ab (\d, \s, Punkt). Deshalb wird jede Zeile auf
+# ihre Klassenfolge abgebildet (z.B. " 0.00000 0.0000 ... 0") und der Regex nur einmal pro
+# verschiedener Folge geprüft; Zeilen mit gleichen Spaltenbreiten teilen sich eine Folge.
+def _is_regular_block(data):
+    if data.translate(None, AOD_CHARACTERS):
+        return False
+    if b'\r' in data and data.count(b'\r') != data.count(b'\r\n'):
+        return False
+    shapes = set(data.translate(AOD_CLASSES).split(b'\n'))
+    return all(not shape.strip() or AOD_DATA_PATTERN.match(shape.decode('ascii')) for shape in shapes)
+
+# Funktion zum spaltenweisen Auswerten der Datenzeilen mit NumPy.
+# data sind die Rohdaten (bytes) oder eine Liste von Zeilen. Reguläre Blöcke werden nach
+# einer einzigen Formatprüfung in einem Durchgang mit np.loadtxt gelesen (nur Zeit und AOD;
+# schneller als split() mit reshape), sonst zeilenweise per Regex.
+# Liefert dieselben Zeilen wie parse_aod_lines, aber als strukturiertes Array.
+@timed('aod.parse')
+def parse_aod_columns(data, current_date, stream=None):
+    if isinstance(data, bytes):
+        lines = None
+    else:
+        lines = data
+        data = ''.join(lines).encode('utf-8')
+
+    if _is_regular_block(data):
+        # Schneller Pfad: Spalte 1 (Zeit) und 5 (AOD) des ganzen Blocks
+        line_count = data.count(b'\n') + (not data.endswith(b'\n') and len(data) > 0)
+        block = np.loadtxt(io.BytesIO(data), usecols=(0, 4), ndmin=2, comments=None) if data.strip() else np.empty((0, 2))
+    else:
+        # Langsamer Pfad bei unregelmäßigen Zeilen: nur Treffer des Regex-Musters verwenden
+        lines = lines if lines is not None else _text_lines(data)
+        line_count = len(lines)
+        groups = [match.group(1, 5) for match in map(AOD_DATA_PATTERN.match, lines) if match]
+        block = np.array(groups, dtype=float).reshape(-1, 2)
+
+    time_in_hours = block[:, 0]
+    hours = time_in_hours.astype(np.int64)
+    minutes = ((time_in_hours - hours) * 60).astype(np.int64)
+    aod = block[:, 1]  # Annahme: Spalte 5 (Index 4) ist AOD-Wert bei 500.4 nm
+
+    result = np.empty(len(block), dtype=AOD_DTYPE)
+    result['date_time'] = np.datetime64(current_date, 'm') + (hours * 60 + minutes).astype('timedelta64[m]')
+    result['aod'] = aod
+    result['aod_flag'] = (stream or get_engine().stream()).flag_array('aod', result['date_time'], aod)
+
+    count('aod_rows_parsed', len(result))
+    count('aod_rows_invalid', line_count - len(result))
+    return result
+
+# Funktion zum spaltenweisen Einlesen einer AOD-Datei (Datenblock direkt als bytes)
+def read_aod_columns(file_path):
+    with stage('aod.read'), open(file_path, 'rb') as file:
+        header = [file.readline() for _ in range(AOD_HEADER_LINES)]
+        data = file.read()
+        count('aod_bytes_read', file.tell())
+
+    current_date = parse_aod_date(header[AOD_DATE_LINE].decode('utf-8', errors='replace'))
+    return parse_aod_columns(data, current_date)
+
+# Kompatibilitätsadapter: strukturiertes Array -> Liste von Tupeln wie bei read_aod_data
+def aod_columns_to_records(columns, filename):
+    return list(zip(
+        columns['date_time'].tolist(),
+        columns['aod'].tolist(),
+        columns['aod_flag'].tolist(),
+        [filename] * len(columns)
+    ))
+
+# Funktion zum Einlesen der AOD-Daten über den spaltenweisen Parser
+def read_aod_data_columnar(file_path):
+    aod_data = aod_columns_to_records(read_aod_columns(file_path), os.path.basename(file_path))
     logging.info(f"{len(aod_data)} gültige Datensätze gefunden.")
     return aod_data
 
-# Funktion zum Speichern der Daten in die Datenbank
-def store_to_database(aod_data):
-    # Lese die Konfigurationsdatei
-    db_config = read_db_config()
+# Funktion zum Einlesen der AOD-Daten mit Regex
+def read_aod_data(file_path):
+    filename = os.path.basename(file_path)
     
-    # Verbinde mit der MySQL-Datenbank
-    db = mysql.connector.connect(
-        host=db_config['host'],
-        user=db_config['user'],
-        password=db_config['password'],
-        database=db_config['database']
-    )
-    cursor = db.cursor()
+    with stage('aod.read'), open(file_path, 'r') as file:
+        lines = file.readlines()
+        count('aod_bytes_read', os.fstat(file.fileno()).st_size)
+        
+    current_date = parse_aod_date(lines[AOD_DATE_LINE])
+    with stage('aod.parse'):
+        aod_data = parse_aod_lines(lines[AOD_HEADER_LINES:], current_date, filename)
+
+    logging.info(f"{len(aod_data)} gültige Datensätze gefunden.")
+    return aod_data
+
+# Funktion zum inkrementellen Einlesen ab einem Byte-Offset (z.B. aus dem Ingest-Manifest).
+# Die Flag-Regeln kommen aus config_file. Gibt (aod_data, neuer Offset) zurück.
+def read_aod_data_incremental(file_path, start_offset=0, config_file=CONFIG_FILE):
+    filename = os.path.basename(file_path)
 
+    with open(file_path, 'rb') as file:
+        header = [file.readline() for _ in range(AOD_HEADER_LINES)]
+        header_end = file.tell()
+
+    # Kopf noch nicht vollständig geschrieben: später erneut versuchen
+    if not header[-1].endswith(b'\n'):
+        return [], start_offset
+
+    current_date = parse_aod_date(header[AOD_DATE_LINE].decode('utf-8', errors='replace'))
+    start_offset = max(start_offset, header_end)
+
+    with stage('aod.read'):
+        data_lines, end_offset = read_complete_lines(file_path, start_offset)
+    count('aod_bytes_read', end_offset - start_offset)
+    stream = get_engine(config_file).stream()
+    aod_data = aod_columns_to_records(parse_aod_columns(data_lines, current_date, stream), filename)
+
+    logging.info(f"{len(aod_data)} neue Datensätze ab Byte {start_offset} gefunden.")
+    return aod_data, end_offset
+
+# Funktion zum Speichern der Daten in die Datenbank
+@timed('aod.store')
+def store_to_database(aod_data, config_file=CONFIG_FILE):
+    inserted = 0
+
+    # Verbindung aus dem gemeinsamen Pool, Bestätigung am Ende der Transaktion
+    with transaction(config_file) as tx:
+        for data in aod_data:
+            datetime_value, aod, aod_flag, filename = data
+
+            # Prüfen, ob der Datensatz bereits vorhanden ist
+            cursor = tx.execute("SELECT COUNT(*) FROM aod_measurements WHERE date_time = %s", (datetime_value,))
+            existing = cursor.fetchone()[0]
+            
+            if existing == 0:
+                query = """
+                INSERT INTO aod_measurements (date_time, aod, aod_flag, filename)
+                VALUES (%s, %s, %s, %s)
+                """
+                tx.execute(query, data)
+                inserted += 1
+                logging.debug("Datensatz in die Datenbank eingefügt: %s, AOD: %s, Flag: %s", datetime_value, aod, aod_flag)
+
+    skipped = len(aod_data) - inserted
+    count('aod_rows_inserted', inserted)
+    count('aod_rows_skipped', skipped)
+    logging.info(f"{inserted} Datensätze wurden in die Datenbank eingefügt, {skipped} übersprungen.")
+    return inserted, skipped
+
+# Funktion zum gebündelten Speichern der Daten in die Datenbank.
+# Setzt einen UNIQUE-Index auf date_time voraus:
+#   ALTER TABLE aod_measurements ADD UNIQUE KEY uq_date_time (date_time);
+@timed('aod.store')
+def store_to_database_bulk(aod_data, chunk_size=1000, config_file=CONFIG_FILE):
+    # Doppelte Zeitstempel innerhalb der Datei entfernen (erster Eintrag gewinnt)
+    unique_rows = {}
     for data in aod_data:
-        datetime_value, aod, aod_flag, filename = data
+        unique_rows.setdefault(data[0], data)
+    rows = list(unique_rows.values())
 
-        # Prüfen, ob der Datensatz bereits vorhanden ist
-        cursor.execute("SELECT COUNT(*) FROM aod_measurements WHERE date_time = %s", (datetime_value,))
-        count = cursor.fetchone()[0]
-        
-        if count == 0:
-            query = """
-            INSERT INTO aod_measurements (date_time, aod, aod_flag, filename)
-            VALUES (%s, %s, %s, %s)
-            """
-            cursor.execute(query, data)
-            logging.debug(f"Datensatz in die Datenbank eingefügt: {datetime_value}, AOD: {aod}, Flag: {aod_flag}")
-
-    # Bestätige die Transaktion und schließe die Verbindung
-    db.commit()
-    cursor.close()
-    db.close()
-
-    logging.info(f"{len(aod_data)} Datensätze wurden in die Datenbank eingefügt.")
-
-def main():
-    directory_path = r'\\ad.pmodwrc.ch\Institute\Departments\WRC\SRS\ancillary_data\AOD\2024'
-    date_threshold = datetime(2024, 8, 6).date()  # Datumsschwelle ab dem 06.08.2024
-    
-    # Liste aller Dateien ab dem 06.08.2024
+    with transaction(config_file) as tx:
+        inserted = tx.insert_ignore_many(
+            'aod_measurements', ('date_time', 'aod', 'aod_flag', 'filename'), rows, chunk_size
+        )
+
+    skipped = len(aod_data) - inserted
+    count('aod_rows_deduplicated', len(aod_data) - len(rows))
+    count('aod_rows_inserted', inserted)
+    count('aod_rows_skipped', len(rows) - inserted)
+    logging.info(f"{inserted} Datensätze wurden in die Datenbank eingefügt, {skipped} übersprungen.")
+    return inserted, skipped
+
+# Funktion zum Auflisten aller AOD-Dateien ab einem Stichtag
+# (mit Cache aus dessen zwischengespeicherter Verzeichnisliste)
+def list_aod_files(directory_path, date_threshold, cache=None):
     valid_files = []
+    names = cache.listdir(directory_path) if cache is not None else os.listdir(directory_path)
 
-    for file in os.listdir(directory_path):
+    for file in names:
         if file.startswith('DAV_N01_') and file.endswith('.003'):
             try:
                 file_date_str = file.split('_')[2].split('.')[0]
@@ -128,13 +265,154 @@ def main():
             except Exception as e:
                 logging.error(f"Fehler beim Verarbeiten der Datei {file}: {e}")
 
-    if valid_files:
-        for file in valid_files:
-            logging.info(f"Verarbeite Datei: {file}")
-            aod_data = read_aod_data(file)
-            store_to_database(aod_data)
-    else:
+    return sorted(valid_files)
+
+# Datei über den Cache holen (falls vorhanden) und mit reader einlesen; läuft im Worker,
+# damit die Kopien parallel laufen. stat ist der Stand, den das Manifest danach speichert:
+# die lokale Kopie wird auf genau diesen Stand geschlüsselt, nicht auf eine ältere Verzeichnisliste.
+def read_cached(reader, file, stat, cache, *args):
+    local_file = cache.fetch(file, stat) if cache is not None else file
+    return reader(local_file, *args)
+
+# Funktion zum Einlesen und Speichern einer einzelnen Datei.
+# Mit Manifest werden unveränderte Dateien übersprungen und wachsende Dateien nur ab dem
+# zuletzt verarbeiteten Offset gelesen. Mit Cache wird eine lokale Kopie gelesen; das
+# Manifest bleibt auf den entfernten Pfad bezogen.
+def ingest_file(file, manifest=None, cache=None):
+    logging.info(f"Verarbeite Datei: {file}")
+    if manifest is None:
+        return store_to_database_bulk(read_cached(read_aod_data_columnar, file, None, cache))
+
+    state = manifest.pending(file)
+    if state is None:
+        logging.info(f"Datei unverändert, übersprungen: {file}")
+        return 0, 0
+
+    stat, offset = state
+    aod_data, end_offset = read_cached(read_aod_data_incremental, file, stat, cache, offset)
+    result = store_to_database_bulk(aod_data)
+    manifest.update(file, stat, end_offset)
+    return result
+
+# Funktion zum parallelen Einlesen mehrerer Dateien.
+# Lesen und Parsen laufen in einem Prozesspool, die Ergebnisse gehen über eine
+# begrenzte Queue an einen einzigen Datenbank-Schreiber.
+def ingest_parallel(files, workers=None, queue_size=8, executor_class=ProcessPoolExecutor, manifest=None, cache=None):
+    batches = queue.Queue(maxsize=queue_size)
+    totals = {'files': 0, 'inserted': 0, 'skipped': 0}
+
+    def writer():
+        while True:
+            item = batches.get()
+            if item is None:
+                break
+            file, aod_data, stat, end_offset = item
+            try:
+                inserted, skipped = store_to_database_bulk(aod_data)
+                # Manifest erst nach erfolgreichem Speichern fortschreiben
+                if manifest is not None:
+                    manifest.update(file, stat, end_offset)
+                totals['files'] += 1
+                totals['inserted'] += inserted
+                totals['skipped'] += skipped
+            except Exception as e:
+                logging.error(f"Fehler beim Speichern der Datei {file}: {e}")
+
+    writer_thread = threading.Thread(target=writer, name='aod-writer', daemon=True)
+    writer_thread.start()
+
+    futures = {}
+    parent_pid = os.getpid()
+
+    def enqueue(future):
+        file, stat = futures[future]
+        try:
+            # Messwerte des Worker-Prozesses übernehmen
+            result = merge_collected(future.result())
+            if stat is None:
+                aod_data, end_offset = result, None
+            else:
+                aod_data, end_offset = result
+            # blockiert, solange die Queue voll ist (Gegendruck auf die Parser)
+            batches.put((file, aod_data, stat, end_offset))
+        except Exception as e:
+            logging.error(f"Fehler beim Einlesen der Datei {file}: {e}")
+
+    try:
+        with executor_class(max_workers=workers) as executor:
+            pending = set()
+            for file in files:
+                if manifest is None:
+                    stat = None
+                    future = executor.submit(collect, parent_pid, read_cached, read_aod_data_columnar, file, None, cache)
+                else:
+                    state = manifest.pending(file)
+                    if state is None:
+                        logging.debug(f"Datei unverändert, übersprungen: {file}")
+                        continue
+                    stat, offset = state
+                    future = executor.submit(collect, parent_pid, read_cached, read_aod_data_incremental,
+                                             file, stat, cache, offset)
+                logging.info(f"Verarbeite Datei: {file}")
+                futures[future] = (file, stat)
+                pending.add(future)
+                # Nicht mehr Dateien gleichzeitig im Speicher halten als die Queue fasst
+                if len(pending) >= queue_size:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        enqueue(future)
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    enqueue(future)
+    finally:
+        batches.put(None)
+        writer_thread.join()
+
+    logging.info(f"{totals['files']} Dateien verarbeitet: {totals['inserted']} Datensätze eingefügt, {totals['skipped']} übersprungen.")
+    return totals
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='AOD-Daten in die Datenbank einlesen')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='Anzahl paralleler Parser-Prozesse (1 = sequentiell)')
+    parser.add_argument('--queue-size', type=int, default=8,
+                        help='Maximale Anzahl geparster Dateien in der Schreib-Queue')
+    parser.add_argument('--manifest', default=DEFAULT_MANIFEST,
+                        help='SQLite-Datei mit dem Stand des inkrementellen Imports')
+    parser.add_argument('--full', action='store_true',
+                        help='Manifest ignorieren und alle Dateien vollständig einlesen')
+    parser.add_argument('--metrics-file', default=None,
+                        help='Messwerte zusätzlich als Prometheus-Textdatei schreiben (z.B. aod2.prom)')
+    args = parser.parse_args(argv)
+    setup_logging()
+
+    directory_path = r'\\ad.pmodwrc.ch\Institute\Departments\WRC\SRS\ancillary_data\AOD\2024'
+    date_threshold = datetime(2024, 8, 6).date()  # Datumsschwelle ab dem 06.08.2024
+    
+    # Optionaler lokaler Cache für die Freigabe (Abschnitt [remote_cache] in config.ini)
+    cache = read_remote_cache_config()
+
+    # Liste aller Dateien ab dem 06.08.2024
+    valid_files = list_aod_files(directory_path, date_threshold, cache)
+
+    if not valid_files:
         logging.error("Keine geeigneten Dateien gefunden")
+        return
+
+    manifest = None if args.full else IngestManifest(args.manifest)
+    try:
+        if args.workers > 1:
+            ingest_parallel(valid_files, workers=args.workers, queue_size=args.queue_size, manifest=manifest, cache=cache)
+        else:
+            for file in valid_files:
+                ingest_file(file, manifest, cache)
+    finally:
+        if manifest is not None:
+            manifest.close()
+        if cache is not None:
+            cache.close()
+        export('aod2', args.metrics_file)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,427 @@
+import argparse
+import importlib.util
+import json
+import logging
+import multiprocessing
+import os
+import platform
+import sqlite3
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager, redirect_stdout
+from datetime import date, datetime, timedelta
+
+import numpy as np
+
+# Das Repository liegt eine Ebene über benchmarks/
+REPO_DIRECTORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIRECTORY)
+
+import aod2
+import wind_data
+from database import Transaction
+from irccam_reader import _image_keys, list_image_keys, load_image
+
+from synthetic_data import write_aod_file, write_irccam_file, write_wind_file
+
+try:
+    import resource
+except ImportError:
+    resource = None  # Windows: kein Spitzen-RSS verfügbar
+
+# Benchmark-Suite für die Ingest- und Erkennungspfade mit synthetischen Daten.
+# Jeder Fall läuft in einem eigenen, frisch gestarteten Prozess, damit der
+# Spitzen-RSS nur diesen Fall misst. Die MySQL-Datenbank wird durch eine lokale
+# SQLite-Datei ersetzt (gleiche Transaktionsschicht, SQL wird übersetzt).
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+DEFAULT_SCALES = (1, 10, 100)
+DEFAULT_TOLERANCE = 0.25
+# Kürzere Laufzeiten schwanken zu stark für einen Zeitvergleich
+MIN_COMPARE_SECONDS = 0.02
+
+# Realistisches Volumen bei Faktor 1×
+AOD_ROWS = 800          # Messungen einer AOD-Tagesdatei
+WIND_DAYS = 7           # Tage in der kumulativen CR7X1.DAT (1440 Zeilen pro Tag)
+IRCCAM_FRAMES = 12      # Bilder in einer IRCCAM-Stundendatei (alle 5 Minuten)
+IRCCAM_SHAPE = (480, 640)
+BENCHMARK_DAY = date(2024, 8, 6)
+
+SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS aod_measurements (
+    date_time TEXT UNIQUE, aod REAL, aod_flag TEXT, filename TEXT
+);
+CREATE TABLE IF NOT EXISTS wind_measurements (
+    date_time TEXT UNIQUE, windspeed REAL, winddirection REAL, wind_flag TEXT, filename TEXT
+);
+"""
+
+
+# --- SQLite-Ersatz für MySQL --------------------------------------------------
+
+# MySQL-Syntax der Ingest-Skripte auf SQLite abbilden
+def translate_sql(sql):
+    return sql.replace('%s', '?').replace('INSERT IGNORE', 'INSERT OR IGNORE')
+
+
+class SqliteCursor:
+    def __init__(self, connection):
+        self._cursor = connection.cursor()
+
+    def execute(self, sql, params=()):
+        self._cursor.execute(translate_sql(sql), tuple(params))
+
+    def executemany(self, sql, rows):
+        self._cursor.executemany(translate_sql(sql), rows)
+
+    def fetchone(self):
+        return self._cursor.fetchone()
+
+    def fetchall(self):
+        return self._cursor.fetchall()
+
+    @property
+    def rowcount(self):
+        return self._cursor.rowcount
+
+    def close(self):
+        self._cursor.close()
+
+
+# Verbindung mit der Schnittstelle der MySQL-Pool-Verbindung (cursor(prepared=...))
+class SqliteConnection:
+    def __init__(self, path):
+        self._connection = sqlite3.connect(path)
+        self._connection.executescript(SQLITE_SCHEMA)
+
+    def cursor(self, prepared=False):
+        return SqliteCursor(self._connection)
+
+    def commit(self):
+        self._connection.commit()
+
+    def rollback(self):
+        self._connection.rollback()
+
+    def close(self):
+        self._connection.close()
+
+
+sqlite3.register_adapter(datetime, lambda value: value.isoformat(sep=' '))
+
+
+# Ersetzt database.transaction in aod2 und wind_data durch die SQLite-Datei
+def use_sqlite(path):
+    @contextmanager
+    def sqlite_transaction(filename=None):
+        connection = SqliteConnection(path)
+        tx = Transaction(connection)
+        try:
+            yield tx
+            connection.commit()
+        except Exception:
+            connection.rollback()
+            raise
+        finally:
+            tx.close()
+            connection.close()
+
+    aod2.transaction = sqlite_transaction
+    wind_data.transaction = sqlite_transaction
+
+
+# --- Eingabedaten -------------------------------------------------------------
+
+def prepare_inputs(directory, scale):
+    os.makedirs(directory, exist_ok=True)
+    return {
+        'aod': write_aod_file(directory, BENCHMARK_DAY, AOD_ROWS * scale),
+        'wind': write_wind_file(directory, BENCHMARK_DAY, WIND_DAYS * scale),
+        'irccam': write_irccam_file(
+            directory, datetime.combine(BENCHMARK_DAY, datetime.min.time()).replace(hour=12),
+            IRCCAM_FRAMES * scale, IRCCAM_SHAPE
+        ),
+    }
+
+
+def wind_window(scale):
+    return BENCHMARK_DAY - timedelta(days=WIND_DAYS * scale - 1), BENCHMARK_DAY
+
+
+# --- Fälle ---------------------------------------------------------------------
+# Jeder Fall bekommt die Eingabedateien und den Faktor und gibt eine Funktion
+# zurück, die die gemessene Arbeit ausführt und die Anzahl verarbeiteter Einheiten
+# liefert. Vorbereitung (Daten laden, Datenbank anlegen) zählt nicht zur Messzeit.
+
+def case_read_aod_data(inputs, scale):
+    return lambda: len(aod2.read_aod_data(inputs['aod']))
+
+
+def case_read_aod_data_columnar(inputs, scale):
+    return lambda: len(aod2.read_aod_data_columnar(inputs['aod']))
+
+
+def case_read_wind_data(inputs, scale):
+    start_date, end_date = wind_window(scale)
+    return lambda: len(wind_data.read_wind_data(inputs['wind'], start_date, end_date))
+
+
+def case_read_wind_data_today(inputs, scale):
+    return lambda: len(wind_data.read_wind_data(inputs['wind'], BENCHMARK_DAY, BENCHMARK_DAY))
+
+
+def _load_find_highest_key():
+    path = os.path.join(REPO_DIRECTORY, 'irccam_12957_cloudettection_with log.py')
+    spec = importlib.util.spec_from_file_location('irccam_cloud_detection_log', path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module.find_highest_key
+
+
+# Bisheriger Pfad: gesamte MAT-Datei laden, höchsten Schlüssel suchen
+def case_loadmat_find_highest_key(inputs, scale):
+    from scipy.io import loadmat
+    find_highest_key = _load_find_highest_key()
+
+    def run():
+        mat_data = loadmat(inputs['irccam'])
+        key = find_highest_key(mat_data)
+        return 1 if mat_data[key]['image'][0, 0] is not None else 0
+    return run
+
+
+# Selektiver Pfad: nur Variablenliste lesen, dann ein einzelnes Bild laden
+def case_selective_latest_image(inputs, scale):
+    def run():
+        # Schlüsselcache leeren, sonst misst jede Wiederholung nach der ersten nur den Cache
+        _image_keys.cache_clear()
+        keys = list_image_keys(inputs['irccam'])
+        return 1 if load_image(inputs['irccam'], keys[-1]) is not None else 0
+    return run
+
+
+def case_detect_cloud_clusters(inputs, scale):
+    from cloud_detection import detect_cloud_clusters
+    keys = list_image_keys(inputs['irccam'])
+    # Wenige Bilder im Speicher halten und zyklisch wiederverwenden
+    frames = [load_image(inputs['irccam'], key) for key in keys[:IRCCAM_FRAMES]]
+    count = len(keys)
+
+    def run():
+        for i in range(count):
+            detect_cloud_clusters(frames[i % len(frames)])
+        return count
+    return run
+
+
+# Wie oben, aber nur auf den Himmelspixeln (Maske einmal vorab berechnet)
+def case_detect_cloud_metrics_masked(inputs, scale):
+    from cloud_detection import detect_cloud_metrics
+    from sky_mask import MaskSettings, get_sky_mask
+    keys = list_image_keys(inputs['irccam'])
+    frames = [load_image(inputs['irccam'], key) for key in keys[:IRCCAM_FRAMES]]
+    settings = MaskSettings(5.0, None, os.path.dirname(inputs['irccam']), False, 80)
+    sky_mask = get_sky_mask(frames[0].shape, settings=settings)
+    count = len(keys)
+
+    def run():
+        for i in range(count):
+            detect_cloud_metrics(frames[i % len(frames)], sky_mask=sky_mask)
+        return count
+    return run
+
+
+def _store_case(records, store):
+    def run():
+        database = tempfile.NamedTemporaryFile(suffix='.sqlite', delete=False)
+        database.close()
+        try:
+            use_sqlite(database.name)
+            inserted, _skipped = store(records)
+            return inserted
+        finally:
+            os.remove(database.name)
+    return run
+
+
+def case_store_aod(inputs, scale):
+    return _store_case(aod2.read_aod_data_columnar(inputs['aod']), aod2.store_to_database)
+
+
+def case_store_aod_bulk(inputs, scale):
+    return _store_case(aod2.read_aod_data_columnar(inputs['aod']), aod2.store_to_database_bulk)
+
+
+def case_store_wind(inputs, scale):
+    records = wind_data.read_wind_data(inputs['wind'], *wind_window(scale))
+    return _store_case(records, wind_data.store_to_database)
+
+
+def case_store_wind_bulk(inputs, scale):
+    records = wind_data.read_wind_data(inputs['wind'], *wind_window(scale))
+    return _store_case(records, wind_data.store_to_database_bulk)
+
+
+# Name -> (Fall, Eingabedatei für MB/s oder None)
+CASES = {
+    'read_aod_data': (case_read_aod_data, 'aod'),
+    'read_aod_data_columnar': (case_read_aod_data_columnar, 'aod'),
+    'read_wind_data': (case_read_wind_data, 'wind'),
+    'read_wind_data_today': (case_read_wind_data_today, 'wind'),
+    'loadmat_find_highest_key': (case_loadmat_find_highest_key, 'irccam'),
+    'selective_latest_image': (case_selective_latest_image, 'irccam'),
+    'detect_cloud_clusters': (case_detect_cloud_clusters, None),
+    'detect_cloud_metrics_masked': (case_detect_cloud_metrics_masked, None),
+    'aod_store_to_database': (case_store_aod, None),
+    'aod_store_to_database_bulk': (case_store_aod_bulk, None),
+    'wind_store_to_database': (case_store_wind, None),
+    'wind_store_to_database_bulk': (case_store_wind_bulk, None),
+}
+
+
+# Spitzen-RSS des aktuellen Prozesses in MB. Unter Linux aus VmHWM, da ru_maxrss
+# den Höchstwert des Elternprozesses über fork/exec hinweg übernimmt.
+def peak_rss_mb():
+    try:
+        with open('/proc/self/status') as file:
+            for line in file:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOS meldet Bytes, die übrigen Systeme KiB
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+# Läuft im Kindprozess: Fall vorbereiten, repeat-mal messen, beste Zeit melden
+def run_case(name, inputs, scale, repeat):
+    logging.disable(logging.INFO)
+    factory, input_name = CASES[name]
+    work = factory(inputs, scale)
+
+    timings = []
+    items = 0
+    for _ in range(repeat):
+        # Ausgaben (z.B. die Schlüsselliste von find_highest_key) nicht auf die Konsole
+        with open(os.devnull, 'w') as devnull, redirect_stdout(devnull):
+            started = time.perf_counter()
+            items = work()
+        timings.append(time.perf_counter() - started)
+
+    seconds = min(timings)
+    result = {
+        'seconds': seconds,
+        'items': items,
+        'items_per_second': items / seconds if seconds else None,
+        'peak_rss_mb': peak_rss_mb(),
+    }
+    if input_name is not None:
+        megabytes = os.path.getsize(inputs[input_name]) / (1024 * 1024)
+        result['megabytes'] = megabytes
+        result['mb_per_second'] = megabytes / seconds if seconds else None
+    return result
+
+
+def run_benchmarks(cases, scales, repeat, work_directory):
+    results = {}
+    context = multiprocessing.get_context('spawn')
+    for scale in scales:
+        inputs = prepare_inputs(os.path.join(work_directory, f"x{scale}"), scale)
+        for name in cases:
+            with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+                result = executor.submit(run_case, name, inputs, scale, repeat).result()
+            key = f"{name}@{scale}x"
+            results[key] = result
+            print(format_result(key, result), flush=True)
+    return results
+
+
+def format_result(key, result):
+    throughput = f"{result['items_per_second']:>12.0f} items/s" if result['items_per_second'] else ' ' * 20
+    megabytes = f"{result['mb_per_second']:>8.1f} MB/s" if result.get('mb_per_second') else ' ' * 13
+    rss = f"{result['peak_rss_mb']:>8.1f} MB RSS" if result['peak_rss_mb'] is not None else ''
+    return f"{key:<36} {result['seconds']:>9.4f} s {throughput} {megabytes} {rss}"
+
+
+# Vergleich mit der gespeicherten Baseline; gibt die Liste der Regressionen zurück
+def compare(results, baseline, tolerance=DEFAULT_TOLERANCE):
+    regressions = []
+    for key, result in results.items():
+        previous = baseline.get('results', {}).get(key)
+        if previous is None:
+            continue
+        time_ratio = result['seconds'] / previous['seconds'] if previous['seconds'] else 1.0
+        if time_ratio > 1 + tolerance and result['seconds'] >= MIN_COMPARE_SECONDS:
+            regressions.append(f"{key}: {time_ratio:.2f}x langsamer ({previous['seconds']:.4f} s -> {result['seconds']:.4f} s)")
+        if result['peak_rss_mb'] and previous.get('peak_rss_mb'):
+            rss_ratio = result['peak_rss_mb'] / previous['peak_rss_mb']
+            if rss_ratio > 1 + tolerance:
+                regressions.append(f"{key}: {rss_ratio:.2f}x mehr Speicher "
+                                   f"({previous['peak_rss_mb']:.1f} MB -> {result['peak_rss_mb']:.1f} MB)")
+    return regressions
+
+
+def save_baseline(path, results):
+    document = {
+        'created_at': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'numpy': np.__version__,
+        'results': results,
+    }
+    with open(path, 'w') as file:
+        json.dump(document, file, indent=1, sort_keys=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmarks für AOD-, Wind- und IRCCAM-Verarbeitung')
+    parser.add_argument('--scales', default=','.join(map(str, DEFAULT_SCALES)),
+                        help='Volumenfaktoren, z.B. 1,10,100 (100x IRCCAM braucht ca. 750 MB Platz)')
+    parser.add_argument('--cases', default=','.join(CASES), help='Kommagetrennte Auswahl der Fälle')
+    parser.add_argument('--repeat', type=int, default=3, help='Wiederholungen pro Fall (beste Zeit zählt)')
+    parser.add_argument('--work-dir', default=None, help='Verzeichnis für die synthetischen Dateien (Standard: temporär)')
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE, help='Pfad der Baseline-JSON-Datei')
+    parser.add_argument('--save-baseline', action='store_true', help='Ergebnisse als neue Baseline speichern')
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE,
+                        help='Erlaubte Verschlechterung gegenüber der Baseline (0.25 = 25 %%)')
+    args = parser.parse_args(argv)
+
+    scales = [int(scale) for scale in args.scales.split(',')]
+    cases = [name for name in args.cases.split(',') if name]
+    unknown = set(cases) - set(CASES)
+    if unknown:
+        parser.error(f"Unbekannte Fälle: {', '.join(sorted(unknown))}")
+
+    if args.work_dir:
+        results = run_benchmarks(cases, scales, args.repeat, args.work_dir)
+    else:
+        with tempfile.TemporaryDirectory(prefix='ancillary_bench_') as work_directory:
+            results = run_benchmarks(cases, scales, args.repeat, work_directory)
+
+    if args.save_baseline:
+        save_baseline(args.baseline, results)
+        print(f"Baseline gespeichert: {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print("Keine Baseline vorhanden (mit --save-baseline anlegen).")
+        return 0
+
+    with open(args.baseline) as file:
+        regressions = compare(results, json.load(file), args.tolerance)
+    if regressions:
+        print("Regressionen gegenüber der Baseline:")
+        for regression in regressions:
+            print(f"  {regression}")
+        return 1
+    print("Keine Regressionen gegenüber der Baseline.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
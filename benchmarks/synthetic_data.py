@@ -0,0 +1,70 @@
+import os
+from datetime import timedelta
+
+import numpy as np
+from scipy.io import savemat
+
+# Generatoren für synthetische Eingabedateien in den drei Formaten:
+#   DAV_N01_YYYYMMDD.003  (AOD, Cimel-ähnlich, 21 Kopfzeilen)
+#   CR7X1.DAT             (Campbell-Logger, kommagetrennt, kumulativ)
+#   irccam_YYYYMMDDHH00.12957 (MAT-Datei mit N img_HHMMSS-Strukturen)
+
+
+def write_aod_file(directory, day, rows, seed=0):
+    rng = np.random.default_rng(seed)
+    path = os.path.join(directory, f"DAV_N01_{day:%Y%m%d}.003")
+    header = [f"% synthetic header line {i + 1}\n" for i in range(21)]
+    header[6] = f"%DATE ={day:%Y-%m-%d}\n"
+
+    # Messungen gleichmäßig über den Tag zwischen 05:00 und 19:00 verteilt
+    hours = np.linspace(5.0, 19.0, rows)
+    aod = np.abs(rng.normal(0.08, 0.04, rows))
+    columns = rng.random((rows, 7)) * 2.0
+    with open(path, 'w') as file:
+        file.writelines(header)
+        for i in range(rows):
+            file.write(
+                f" {hours[i]:.5f} {columns[i, 0]:.4f} {columns[i, 1]:.4f} {columns[i, 2]:.4f} "
+                f"{aod[i]:.4f} {columns[i, 3]:.4f} {columns[i, 4]:.4f} {columns[i, 5]:.4f} {i % 10}\n"
+            )
+    return path
+
+
+# Kumulative Logger-Datei mit einer Zeile pro Minute über `days` Tage bis einschließlich last_day
+def write_wind_file(directory, last_day, days, seed=0):
+    rng = np.random.default_rng(seed)
+    path = os.path.join(directory, 'CR7X1.DAT')
+    first_day = last_day - timedelta(days=days - 1)
+    with open(path, 'w', newline='') as file:
+        for offset in range(days):
+            day = first_day + timedelta(days=offset)
+            julian_day = day.timetuple().tm_yday
+            speeds = np.abs(rng.normal(1.5, 1.0, 1440))
+            directions = rng.random(1440) * 360.0
+            lines = []
+            for minute in range(1440):
+                hhmm = (minute // 60) * 100 + minute % 60
+                parts = ['101', str(day.year), str(julian_day), str(hhmm)]
+                parts += ['0.000'] * 19
+                parts += [f"{speeds[minute]:.3f}", '0.000', '0.000', f"{directions[minute]:.1f}"]
+                lines.append(','.join(parts) + '\r\n')
+            file.writelines(lines)
+    return path
+
+
+def write_irccam_file(directory, hour, frames, shape=(480, 640), seed=0):
+    rng = np.random.default_rng(seed)
+    path = os.path.join(directory, f"irccam_{hour:%Y%m%d%H}00.12957")
+    interval = max(1, 3600 // max(frames, 1))
+    variables = {}
+    for i in range(frames):
+        seconds = i * interval
+        key = f"img_{hour:%H}{seconds // 60 % 60:02d}{seconds % 60:02d}"
+        image = rng.normal(20000, 1500, shape).astype(np.uint16)
+        # Einige helle "Wolken" einstreuen
+        for _ in range(20):
+            y, x = rng.integers(0, shape[0] - 20), rng.integers(0, shape[1] - 20)
+            image[y:y + 15, x:x + 15] = 60000
+        variables[key] = {'image': image, 'exposure': 1.0}
+    savemat(path, variables, do_compression=False)
+    return path
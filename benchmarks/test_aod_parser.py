@@ -0,0 +1,96 @@
+import os
+import random
+import sys
+import tempfile
+from datetime import date
+
+# Das Repository liegt eine Ebene über benchmarks/
+REPO_DIRECTORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIRECTORY)
+
+import aod2
+from flag_rules import FlagEngine
+
+from synthetic_data import write_aod_file
+
+# Gleichwertigkeit des spaltenweisen Parsers (parse_aod_columns, schneller Pfad und
+# Regex-Rückfall) mit dem zeilenweisen Regex-Parser (parse_aod_lines) auf zufällig
+# gestörten Datenblöcken. Läuft mit pytest oder direkt:
+#   python benchmarks/test_aod_parser.py
+
+DAY = date(2024, 8, 29)
+ROUNDS = 300
+
+# Störungen, die eine reguläre Zeile vom Regex-Muster abweichen lassen (oder gerade nicht)
+TOKENS = ['12', '1.', '.5', '1..2', '1e3', '-0.1', '+0.1', 'nan', 'inf', '0.1.2', '7', '3.25', '', 'x', 'ä']
+SEPARATORS = [' ', '  ', '\t', ' \t ']
+LINE_ENDS = ['\n', '\n', '\n', '\r\n', '\r', '']
+
+
+def _regular_line(rng):
+    values = [f"{rng.uniform(5, 19):.5f}"] + [f"{rng.uniform(0, 2):.4f}" for _ in range(7)]
+    return ' ' + ' '.join(values + [str(rng.randrange(10))])
+
+
+def _disturbed_line(rng):
+    tokens = _regular_line(rng).split()
+    kind = rng.randrange(6)
+    if kind == 0:
+        tokens[rng.randrange(len(tokens))] = rng.choice(TOKENS)
+    elif kind == 1:
+        tokens.extend(rng.choice(TOKENS[:12]) for _ in range(rng.randrange(1, 4)))
+    elif kind == 2:
+        del tokens[rng.randrange(len(tokens)):]
+    elif kind == 3:
+        return rng.choice(['', ' ', '\t', '% Kommentar'])
+    separator = rng.choice(SEPARATORS)
+    return rng.choice(['', ' ', '\t']) + separator.join(tokens) + rng.choice(['', ' ', '\t'])
+
+
+def _random_block(rng, lines):
+    text = []
+    for _ in range(lines):
+        line = _regular_line(rng) if rng.random() < 0.8 else _disturbed_line(rng)
+        text.append(line + rng.choice(LINE_ENDS if rng.random() < 0.1 else ['\n']))
+    return ''.join(text).encode('utf-8')
+
+
+def _regex_records(data):
+    lines = aod2._text_lines(data)
+    return [record[:3] for record in aod2.parse_aod_lines(lines, DAY, 'x', stream=FlagEngine().stream())]
+
+
+def _columnar_records(data):
+    columns = aod2.parse_aod_columns(data, DAY, stream=FlagEngine().stream())
+    return [record[:3] for record in aod2.aod_columns_to_records(columns, 'x')]
+
+
+def test_regular_block_takes_fast_path():
+    rng = random.Random(1)
+    data = ''.join(_regular_line(rng) + '\n' for _ in range(100)).encode('utf-8')
+    assert aod2._is_regular_block(data)
+    assert _columnar_records(data) == _regex_records(data)
+
+
+def test_columnar_matches_regex_on_disturbed_blocks():
+    rng = random.Random(0)
+    for round_number in range(ROUNDS):
+        data = _random_block(rng, rng.randrange(0, 40))
+        assert _columnar_records(data) == _regex_records(data), f"Abweichung in Runde {round_number}: {data!r}"
+        # Zeilenliste statt bytes (wie von read_complete_lines)
+        lines = aod2._text_lines(data)
+        columns = aod2.parse_aod_columns(lines, DAY, stream=FlagEngine().stream())
+        assert [record[:3] for record in aod2.aod_columns_to_records(columns, 'x')] == _regex_records(data)
+
+
+def test_file_readers_agree():
+    with tempfile.TemporaryDirectory() as directory:
+        path = write_aod_file(directory, DAY, 2000)
+        assert aod2.read_aod_data_columnar(path) == aod2.read_aod_data(path)
+
+
+if __name__ == '__main__':
+    for name, test in list(globals().items()):
+        if name.startswith('test_'):
+            test()
+            print(f"{name}: ok")
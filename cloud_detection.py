@@ -0,0 +1,127 @@
+import cv2
+import numpy as np
+
+from config import CONFIG_FILE, read_config
+from sky_mask import sun_roi
+from solar_geometry import DEFAULT_CAMERA, cached_solar_position, sun_to_pixel
+
+# Wolkenerkennung und Sonnenstand für IRCCAM-Bilder, gemeinsam genutzt vom
+# Einzeldatei-Skript und der Stapelverarbeitung.
+
+SUN_POSITION = (320, 240)  # Bildmitte, falls keine Sonnenposition übergeben wird
+CLOUD_THRESHOLD = 200
+# Kleinere Komponenten sind Rauschen. Komponenten mit nur einer Zeile oder Spalte
+# werden immer verworfen; bei der Konturauswertung hatten sie die Fläche 0 (m00 == 0).
+MIN_CLUSTER_AREA = 3
+
+# Wolkenerkennung in einem Durchgang mit connectedComponentsWithStats.
+# Liefert Schwerpunkte, Flächen und Bounding-Boxen aller Wolkencluster als Arrays,
+# die Abstände zum Sonnenpixel (vektorisiert), den Bedeckungsgrad und den minimalen Abstand.
+# Mit sky_mask (siehe sky_mask.get_sky_mask) werden nur Himmelspixel ausgewertet.
+# Cluster unter min_area Pixeln oder mit Breite/Höhe 1 zählen nicht.
+def detect_cloud_metrics(image_data, sun_position=SUN_POSITION, sky_mask=None, min_area=MIN_CLUSTER_AREA):
+    if sky_mask is not None:
+        return _detect_masked(image_data, sun_position, sky_mask, min_area)
+
+    gray_image = cv2.normalize(image_data, None, 0, 255, cv2.NORM_MINMAX).astype(np.uint8)
+    _, binary_image = cv2.threshold(gray_image, CLOUD_THRESHOLD, 255, cv2.THRESH_BINARY)
+    _, _, stats, centroids = cv2.connectedComponentsWithStats(binary_image, connectivity=8)
+
+    # Label 0 ist der Hintergrund
+    cloud_cover = float(np.count_nonzero(binary_image)) / binary_image.size
+    return _cloud_metrics(stats[1:], centroids[1:], sun_position, cloud_cover, min_area)
+
+# Kennzahlen aus den Komponenten (ohne Hintergrund) berechnen; entartete und zu
+# kleine Komponenten werden verworfen (der Bedeckungsgrad zählt weiterhin alle Pixel).
+# scale ist die Pixelgröße, in der eine Komponente bestimmt wurde (2 = halbe Auflösung).
+def _cloud_metrics(stats, centroids, sun_position, cloud_cover, min_area=MIN_CLUSTER_AREA, scale=1):
+    keep = ((stats[:, cv2.CC_STAT_WIDTH] > scale) & (stats[:, cv2.CC_STAT_HEIGHT] > scale)
+            & (stats[:, cv2.CC_STAT_AREA] >= min_area * scale ** 2))
+    stats = stats[keep]
+    centroids = centroids[keep]
+    distances = np.hypot(centroids[:, 0] - sun_position[0], centroids[:, 1] - sun_position[1])
+
+    return {
+        'centroids': centroids,
+        'areas': stats[:, cv2.CC_STAT_AREA],
+        'bounding_boxes': stats[:, :cv2.CC_STAT_AREA],  # x, y, Breite, Höhe
+        'distances': distances,
+        'cloud_cover': cloud_cover,
+        'min_distance': float(distances.min()) if len(distances) else None,
+    }
+
+# Binärbild der Wolkenpixel innerhalb der Maske (uint8, 0/1)
+def _cloud_pixels(image, mask, limit):
+    return ((image >= limit) & (mask > 0)).view(np.uint8)
+
+# Komponenten eines Binärbildes ohne Hintergrund, verschoben um offset (x, y)
+def _components(binary, offset):
+    _, _, stats, centroids = cv2.connectedComponentsWithStats(binary, connectivity=8)
+    stats = stats[1:].copy()
+    stats[:, cv2.CC_STAT_LEFT] += offset[0]
+    stats[:, cv2.CC_STAT_TOP] += offset[1]
+    return stats, centroids[1:] + offset
+
+# Erkennung nur im umschließenden Rechteck der Himmelsmaske. Die Normierung auf
+# 0..255 nutzt Minimum und Maximum der Himmelspixel; der Schwellenwert wird direkt
+# auf die Rohwerte umgerechnet (entspricht normalize + uint8 + threshold).
+# Mit sky_mask.coarse werden die Wolkenpixel auf halber Auflösung bestimmt
+# und nur im Ausschnitt um die Sonne in voller Auflösung; die Cluster werden danach
+# auf dem zusammengesetzten Binärbild gesucht, damit sie an der Grenze nicht zerfallen.
+def _detect_masked(image_data, sun_position, sky_mask, min_area=MIN_CLUSTER_AREA):
+    x, y, width, height = sky_mask.bounds
+    image = image_data[y:y + height, x:x + width]
+    mask = sky_mask.mask[y:y + height, x:x + width]
+
+    low, high, _, _ = cv2.minMaxLoc(image, mask)
+    if high <= low:
+        return _cloud_metrics(np.empty((0, 5), dtype=np.int32), np.empty((0, 2)), sun_position, 0.0, min_area)
+    limit = low + (CLOUD_THRESHOLD + 1) * (high - low) / 255.0
+
+    scale = 1
+    if sky_mask.coarse:
+        # Jedes zweite Pixel ohne Glättung, damit Clusterränder nicht schrumpfen
+        small_binary = _cloud_pixels(image[::2, ::2], mask[::2, ::2], limit)
+        binary = cv2.resize(small_binary, (width, height), interpolation=cv2.INTER_NEAREST)
+        binary &= mask > 0
+        x0, y0, x1, y1 = sun_roi(image.shape, (sun_position[0] - x, sun_position[1] - y), sky_mask.roi_radius)
+        if x1 > x0 and y1 > y0:
+            binary[y0:y1, x0:x1] = _cloud_pixels(image[y0:y1, x0:x1], mask[y0:y1, x0:x1], limit)
+    else:
+        binary = _cloud_pixels(image, mask, limit)
+
+    stats, centroids = _components(binary, (x, y))
+    if sky_mask.coarse:
+        # Ein Pixel der halben Auflösung wird zu 2x2 Pixeln; nur Komponenten ganz im
+        # Sonnenausschnitt wurden in voller Auflösung bestimmt
+        left = stats[:, cv2.CC_STAT_LEFT] - x
+        top = stats[:, cv2.CC_STAT_TOP] - y
+        inside = ((left >= x0) & (top >= y0) & (left + stats[:, cv2.CC_STAT_WIDTH] <= x1)
+                  & (top + stats[:, cv2.CC_STAT_HEIGHT] <= y1))
+        scale = np.where(inside, 1, 2)
+    cloud_cover = float(np.count_nonzero(binary)) / sky_mask.pixels
+    return _cloud_metrics(stats, centroids, sun_position, cloud_cover, min_area, scale)
+
+# Funktion zur Wolkenerkennung basierend auf einem Schwellenwert
+# (Liste der Cluster-Schwerpunkte als ganzzahlige (x, y)-Tupel)
+def detect_cloud_clusters(image_data):
+    centroids = detect_cloud_metrics(image_data)['centroids']
+    return [(int(cx), int(cy)) for cx, cy in centroids]
+
+# Funktion zur Berechnung der Sonnenposition (Azimut, Elevation in Grad).
+# Nutzt die zwischengespeicherte Minutentabelle des Tages statt pysolar.
+def calculate_sun_position(timestamp, latitude, longitude, altitude=0):
+    azimuth, elevation = cached_solar_position([timestamp], latitude, longitude)
+    return float(azimuth[0]), float(elevation[0])
+
+# Sonnenposition als Pixelkoordinaten (x, y) im IRCCAM-Bild
+def calculate_sun_pixel(azimuth, elevation, camera=DEFAULT_CAMERA):
+    x, y = sun_to_pixel(azimuth, elevation, camera)
+    return float(x), float(y)
+
+# Mindestgröße der Wolkencluster aus dem Abschnitt [irccam] der config.ini, z.B.
+#   [irccam]
+#   min_cluster_area = 5
+def read_min_cluster_area(filename=CONFIG_FILE, section='irccam'):
+    parser = read_config(filename)
+    return parser.getint(section, 'min_cluster_area', fallback=MIN_CLUSTER_AREA)
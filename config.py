@@ -0,0 +1,16 @@
+import configparser
+from functools import lru_cache
+
+# Gemeinsamer Zugriff auf die config.ini für alle Module (Datenbank, Kamera,
+# Himmelsmaske, Bildspeicher, Cache, Flag-Regeln). Kommentare mit ; sind überall
+# auch hinter den Werten erlaubt (key = 5  ; Kommentar). Jede Datei wird pro
+# Prozess nur einmal gelesen.
+
+CONFIG_FILE = 'config.ini'
+
+
+@lru_cache(maxsize=None)
+def read_config(filename=CONFIG_FILE):
+    parser = configparser.ConfigParser(inline_comment_prefixes=(';',))
+    parser.read(filename)
+    return parser
@@ -0,0 +1,152 @@
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from functools import lru_cache
+
+from mysql.connector import pooling
+
+from config import CONFIG_FILE, read_config
+
+# Gemeinsame Datenbankschicht für alle Ingest-Skripte (AOD, Wind, IRCCAM).
+# Die Konfiguration wird einmal pro Prozess gelesen, Verbindungen kommen aus
+# einem begrenzten Pool und werden nach Gebrauch wieder zurückgegeben.
+
+POOL_NAME = 'ancillary'
+DEFAULT_POOL_SIZE = 4
+DEFAULT_CHUNK_SIZE = 1000
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+@lru_cache(maxsize=None)
+def _read_config_section(filename, section):
+    parser = read_config(filename)
+
+    if not parser.has_section(section):
+        raise Exception(f'{section} not found in the {filename} file')
+
+    return tuple(parser.items(section))
+
+
+# Funktion zum Lesen der Konfigurationsdatei (wird pro Datei nur einmal geparst)
+def read_db_config(filename=CONFIG_FILE, section='mysql'):
+    return dict(_read_config_section(filename, section))
+
+
+# Pool für eine Konfigurationsdatei holen bzw. beim ersten Aufruf anlegen
+def get_pool(filename=CONFIG_FILE):
+    with _pools_lock:
+        pool = _pools.get(filename)
+        if pool is None:
+            db_config = read_db_config(filename)
+            pool_size = int(db_config.get('pool_size', DEFAULT_POOL_SIZE))
+            pool = pooling.MySQLConnectionPool(
+                pool_name=f"{POOL_NAME}_{len(_pools)}",
+                pool_size=pool_size,
+                pool_reset_session=True,
+                host=db_config['host'],
+                user=db_config['user'],
+                password=db_config['password'],
+                database=db_config['database']
+            )
+            _pools[filename] = pool
+            logging.info(f"Verbindungspool mit {pool_size} Verbindungen angelegt.")
+        return pool
+
+
+# Verbindung aus dem Pool holen; ist der Pool erschöpft, wird bis zum Timeout gewartet.
+# connection.close() gibt die Verbindung an den Pool zurück.
+def acquire_connection(filename=CONFIG_FILE, timeout=30.0):
+    pool = get_pool(filename)
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            return pool.get_connection()
+        except pooling.PoolError:
+            if time.monotonic() >= deadline:
+                raise
+            time.sleep(0.05)
+
+
+# Zahlenwert aus der Datenbank als float; DECIMAL-Spalten kommen je nach Treiber
+# als Decimal zurück. None bleibt None.
+def to_float(value):
+    return float(value) if value is not None else None
+
+
+# Zeile von ancillary.image_irccam bzw. analyze_frame (mit BLOB oder Bildspeicher); die
+# letzten vier Spalten sind immer sun_azimuth, sun_elevation, cloud_flag, cloud_distance.
+# Gibt (Zeitstempel, Azimut, Elevation, 'ok'/'flag', Distanz) mit float-Werten zurück.
+def cloud_row(row):
+    azimuth, elevation, cloud_flag, cloud_distance = row[-4:]
+    return row[0], to_float(azimuth), to_float(elevation), 'flag' if cloud_flag else 'ok', to_float(cloud_distance)
+
+
+@contextmanager
+def get_connection(filename=CONFIG_FILE):
+    connection = acquire_connection(filename)
+    try:
+        yield connection
+    finally:
+        connection.close()
+
+
+# Eine Transaktion auf einer Pool-Verbindung. Prepared Statements werden pro
+# SQL-Text zwischengespeichert, sodass wiederholte Abfragen nur einmal vom
+# Server vorbereitet werden.
+class Transaction:
+    def __init__(self, connection):
+        self.connection = connection
+        self._cursors = {}
+
+    def cursor(self, sql):
+        cursor = self._cursors.get(sql)
+        if cursor is None:
+            cursor = self.connection.cursor(prepared=True)
+            self._cursors[sql] = cursor
+        return cursor
+
+    def execute(self, sql, params=()):
+        cursor = self.cursor(sql)
+        cursor.execute(sql, params)
+        return cursor
+
+    # Mehrzeiliges INSERT IGNORE in Blöcken; gibt die Anzahl eingefügter Zeilen zurück.
+    # Alle vollen Blöcke teilen sich dasselbe vorbereitete Statement.
+    def insert_ignore_many(self, table, columns, rows, chunk_size=DEFAULT_CHUNK_SIZE):
+        row_placeholder = "(" + ", ".join(["%s"] * len(columns)) + ")"
+        inserted = 0
+        for start in range(0, len(rows), chunk_size):
+            chunk = rows[start:start + chunk_size]
+            sql = (
+                f"INSERT IGNORE INTO {table} ({', '.join(columns)}) "
+                f"VALUES {', '.join([row_placeholder] * len(chunk))}"
+            )
+            cursor = self.execute(sql, [value for row in chunk for value in row])
+            # Bei INSERT IGNORE zählt rowcount nur die tatsächlich eingefügten Zeilen
+            inserted += cursor.rowcount
+        return inserted
+
+    def commit(self):
+        self.connection.commit()
+
+    def close(self):
+        for cursor in self._cursors.values():
+            cursor.close()
+        self._cursors.clear()
+
+
+@contextmanager
+def transaction(filename=CONFIG_FILE):
+    with get_connection(filename) as connection:
+        tx = Transaction(connection)
+        try:
+            yield tx
+            connection.commit()
+        except Exception:
+            connection.rollback()
+            raise
+        finally:
+            tx.close()
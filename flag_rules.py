@@ -0,0 +1,259 @@
+import argparse
+import logging
+import operator
+from collections import namedtuple
+from datetime import datetime
+from functools import lru_cache
+
+import numpy as np
+
+from config import CONFIG_FILE, read_config
+from database import get_connection, to_float
+from rolling_window import RollingWindow
+
+# Regelwerk für die Qualitätsflags von AOD, Wind und Wolken.
+# Die Schwellen stehen nicht mehr im Code, sondern als Abschnitte
+# [flag_rule <name>] in der config.ini neben [mysql]. Eine Regel prüft entweder
+# den einzelnen Messwert oder eine Statistik (mean/min/max) über ein gleitendes
+# Fenster von n Minuten. Die Fenster werden pro Messpunkt in amortisiert O(1)
+# nachgeführt (RollingWindow), sodass Blöcke eines Datenstroms fortlaufend
+# ausgewertet werden können. Ohne Konfiguration gelten die bisherigen Schwellen.
+#
+#   [flag_rule aod_mean_15min]
+#   sensor = aod
+#   ; value, mean, min oder max
+#   statistic = mean
+#   minutes = 15
+#   operator = >
+#   threshold = 0.10
+#   ; flag oder error
+#   result = flag
+#
+# Eine Standardregel wird mit gleichem Namen überschrieben oder mit enabled = false abgeschaltet.
+#
+# Die Fenster bestehen nur, solange ein FlagStream lebt: watch_daemon führt sie über
+# alle Durchläufe weiter. Die Einmal-Skripte (aod2, wind_data per Cron) beginnen bei
+# jedem Aufruf mit leeren Fenstern, die ersten Minuten eines neuen Abschnitts werden
+# also nur mit den bisher gelesenen Punkten bewertet. Danach mit reflag_database
+# (python flag_rules.py --start ... --end ...) über den ganzen Zeitraum korrigieren.
+
+Rule = namedtuple('Rule', ['name', 'sensor', 'statistic', 'operator', 'threshold', 'minutes', 'result'])
+
+OPERATORS = {'>': operator.gt, '>=': operator.ge, '<': operator.lt, '<=': operator.le}
+STATISTICS = {'mean': 'mean', 'min': 'minimum', 'max': 'maximum'}
+SENSORS = ('aod', 'wind', 'cloud')
+
+# Schweregrad: der schwerste ausgelöste Befund bestimmt das Flag
+FLAGS = ('ok', 'flag', 'error')
+SEVERITY = {flag: level for level, flag in enumerate(FLAGS)}
+
+# Bisherige fest eingebaute Schwellen (Wert für Wolken: Anzahl der Wolkencluster)
+DEFAULT_RULES = (
+    Rule('aod_negative', 'aod', 'value', '<', 0.0, None, 'error'),
+    Rule('aod_high', 'aod', 'value', '>', 0.12, None, 'flag'),
+    Rule('wind_negative', 'wind', 'value', '<', 0.0, None, 'error'),
+    Rule('wind_high', 'wind', 'value', '>=', 2.5, None, 'flag'),
+    Rule('cloud_present', 'cloud', 'value', '>=', 1, None, 'flag'),
+)
+
+RULE_SECTION_PREFIX = 'flag_rule '
+
+# Tabellen für das nachträgliche Neu-Flaggen: (Tabelle, Wertspalte, Flagspalte).
+# Für die Wolken ist die Clusteranzahl nicht gespeichert, sie werden hier nicht neu bewertet.
+REFLAG_TABLES = {
+    'aod': ('aod_measurements', 'aod', 'aod_flag'),
+    'wind': ('wind_measurements', 'windspeed', 'wind_flag'),
+}
+
+
+def _parse_rule(parser, section):
+    name = section[len(RULE_SECTION_PREFIX):].strip()
+    statistic = parser.get(section, 'statistic', fallback='value')
+    rule = Rule(
+        name=name,
+        sensor=parser.get(section, 'sensor'),
+        statistic=statistic,
+        operator=parser.get(section, 'operator', fallback='>'),
+        threshold=parser.getfloat(section, 'threshold'),
+        minutes=parser.getint(section, 'minutes') if statistic != 'value' else None,
+        result=parser.get(section, 'result', fallback='flag'),
+    )
+    if rule.sensor not in SENSORS:
+        raise ValueError(f"Regel {name}: unbekannter Sensor {rule.sensor}")
+    if rule.statistic != 'value' and rule.statistic not in STATISTICS:
+        raise ValueError(f"Regel {name}: unbekannte Statistik {rule.statistic}")
+    if rule.sensor == 'cloud' and rule.statistic != 'value':
+        # Die Bilder werden einzeln in Worker-Prozessen ausgewertet
+        raise ValueError(f"Regel {name}: für cloud sind nur Punktregeln (statistic = value) möglich")
+    if rule.operator not in OPERATORS:
+        raise ValueError(f"Regel {name}: unbekannter Operator {rule.operator}")
+    if rule.result not in ('flag', 'error'):
+        raise ValueError(f"Regel {name}: Ergebnis muss flag oder error sein")
+    return rule
+
+
+# Regeln aus der config.ini lesen; Standardregeln gelten, sofern nicht überschrieben
+def load_rules(filename=CONFIG_FILE):
+    parser = read_config(filename)
+
+    rules = {rule.name: rule for rule in DEFAULT_RULES}
+    for section in parser.sections():
+        if not section.startswith(RULE_SECTION_PREFIX):
+            continue
+        name = section[len(RULE_SECTION_PREFIX):].strip()
+        if not parser.getboolean(section, 'enabled', fallback=True):
+            rules.pop(name, None)
+            continue
+        rules[name] = _parse_rule(parser, section)
+    return tuple(rules.values())
+
+
+class FlagEngine:
+    def __init__(self, rules=DEFAULT_RULES):
+        self.rules = tuple(rules)
+        self._point_rules = {sensor: [] for sensor in SENSORS}
+        self._window_rules = {sensor: [] for sensor in SENSORS}
+        for rule in self.rules:
+            target = self._point_rules if rule.statistic == 'value' else self._window_rules
+            target[rule.sensor].append(rule)
+
+    def has_window_rules(self, sensor):
+        return bool(self._window_rules[sensor])
+
+    # Neuer Auswertungszustand (gleitende Fenster) für einen zusammenhängenden Datenstrom
+    def stream(self):
+        return FlagStream(self)
+
+    # Nur die Punktregeln, vektorisiert; gibt Schweregrade (0/1/2) zurück. NaN = Fehler.
+    def point_severity(self, sensor, values):
+        values = np.asarray(values, dtype=float)
+        severity = np.where(np.isnan(values), SEVERITY['error'], SEVERITY['ok'])
+        with np.errstate(invalid='ignore'):
+            for rule in self._point_rules[sensor]:
+                hit = OPERATORS[rule.operator](values, rule.threshold)
+                severity = np.maximum(severity, np.where(hit, SEVERITY[rule.result], SEVERITY['ok']))
+        return severity
+
+    def point_flag(self, sensor, value):
+        if value is None or value != value:
+            return 'error'
+        severity = SEVERITY['ok']
+        for rule in self._point_rules[sensor]:
+            if OPERATORS[rule.operator](value, rule.threshold):
+                severity = max(severity, SEVERITY[rule.result])
+        return FLAGS[severity]
+
+
+class FlagStream:
+    def __init__(self, engine):
+        self.engine = engine
+        self._windows = {
+            sensor: {rule.minutes: RollingWindow(rule.minutes) for rule in engine._window_rules[sensor]}
+            for sensor in SENSORS
+        }
+
+    # Einen Messpunkt bewerten (zeitlich aufsteigend). Werte mit Punktbefund "error"
+    # gehen nicht in die Fenster ein, damit Fehlwerte die Statistik nicht verfälschen.
+    def flag(self, sensor, timestamp, value):
+        flag = self.engine.point_flag(sensor, value)
+        if flag == 'error' or not self._windows[sensor]:
+            return flag
+
+        windows = self._windows[sensor]
+        for window in windows.values():
+            window.add(timestamp, value)
+        severity = SEVERITY[flag]
+        for rule in self.engine._window_rules[sensor]:
+            observed = getattr(windows[rule.minutes], STATISTICS[rule.statistic])
+            if observed is not None and OPERATORS[rule.operator](observed, rule.threshold):
+                severity = max(severity, SEVERITY[rule.result])
+        return FLAGS[severity]
+
+    # Block von Messpunkten bewerten; gibt ein Array mit Flags zurück.
+    # Ohne Fensterregeln rein vektorisiert, sonst ein Durchlauf mit O(1) pro Punkt.
+    def flag_array(self, sensor, timestamps, values):
+        if not self._windows[sensor]:
+            severity = self.engine.point_severity(sensor, values)
+            return np.array(FLAGS, dtype='U5')[severity]
+        if isinstance(timestamps, np.ndarray):
+            timestamps = timestamps.tolist()
+        return np.array([self.flag(sensor, timestamp, value) for timestamp, value in zip(timestamps, values)],
+                        dtype='U5')
+
+    # Datensätze (Tupel wie von read_aod_data/read_wind_data) mit neu berechnetem Flag zurückgeben
+    def flag_records(self, sensor, records, value_index, flag_index):
+        flags = self.flag_array(sensor, [record[0] for record in records], [record[value_index] for record in records])
+        flagged = []
+        for record, flag in zip(records, flags.tolist()):
+            values = list(record)
+            values[flag_index] = flag
+            flagged.append(type(record)(*values) if hasattr(record, '_fields') else tuple(values))
+        return flagged
+
+
+# Regelwerk einer Konfigurationsdatei (pro Prozess nur einmal gelesen)
+@lru_cache(maxsize=None)
+def get_engine(filename=CONFIG_FILE):
+    return FlagEngine(load_rules(filename))
+
+
+# Gespeicherte Messwerte eines Zeitraums mit dem aktuellen Regelwerk neu bewerten,
+# ohne die Rohdateien erneut zu lesen. Nur geänderte Flags werden blockweise per
+# executemany aktualisiert. Gibt (geprüft, geändert) zurück.
+def reflag_database(sensor, start, end, config_file=CONFIG_FILE, engine=None, chunk_size=5000):
+    table, value_column, flag_column = REFLAG_TABLES[sensor]
+    engine = engine or get_engine(config_file)
+    stream = engine.stream()
+    checked = 0
+    changes = []
+
+    with get_connection(config_file) as connection:
+        cursor = connection.cursor()
+        try:
+            cursor.execute(
+                f"SELECT date_time, {value_column}, {flag_column} FROM {table} "
+                f"WHERE date_time BETWEEN %s AND %s ORDER BY date_time",
+                (start, end)
+            )
+            while True:
+                rows = cursor.fetchmany(chunk_size)
+                if not rows:
+                    break
+                checked += len(rows)
+                timestamps, values, old_flags = zip(*rows)
+                new_flags = stream.flag_array(sensor, list(timestamps), [to_float(value) for value in values]).tolist()
+                changes.extend(
+                    (new_flag, timestamp)
+                    for timestamp, old_flag, new_flag in zip(timestamps, old_flags, new_flags)
+                    if new_flag != old_flag
+                )
+
+            update_sql = f"UPDATE {table} SET {flag_column} = %s WHERE date_time = %s"
+            for offset in range(0, len(changes), chunk_size):
+                cursor.executemany(update_sql, changes[offset:offset + chunk_size])
+            connection.commit()
+        finally:
+            cursor.close()
+
+    logging.info(f"{sensor}: {checked} Datensätze geprüft, {len(changes)} Flags geändert.")
+    return checked, len(changes)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Gespeicherte Messungen mit den aktuellen Flag-Regeln neu bewerten')
+    parser.add_argument('--sensor', choices=sorted(REFLAG_TABLES), action='append')
+    parser.add_argument('--start', required=True, type=datetime.fromisoformat, help='Beginn, z.B. 2024-08-01')
+    parser.add_argument('--end', required=True, type=datetime.fromisoformat, help='Ende, z.B. 2024-08-31T23:59')
+    parser.add_argument('--config', default=CONFIG_FILE)
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s:%(levelname)s:%(message)s')
+    engine = get_engine(args.config)
+    for rule in engine.rules:
+        logging.info(f"Regel {rule.name}: {rule.sensor} {rule.statistic} {rule.operator} {rule.threshold} -> {rule.result}")
+    for sensor in args.sensor or sorted(REFLAG_TABLES):
+        reflag_database(sensor, args.start, args.end, args.config, engine)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+import hashlib
+import os
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+
+from config import CONFIG_FILE, read_config
+
+# Inhaltsadressierter Bildspeicher auf der Festplatte für IRCCAM-Bilder.
+# Jedes Bild wird einmal kodiert (PNG oder WebP, Kompression einstellbar) und
+# zusammen mit einem kleinen Vorschaubild unter seinem SHA-256-Hash abgelegt.
+# In ancillary.image_irccam werden dann nur noch Pfad und Hash gespeichert.
+
+FORMATS = {
+    'png': ('.png', cv2.IMWRITE_PNG_COMPRESSION),
+    'webp': ('.webp', cv2.IMWRITE_WEBP_QUALITY),
+}
+
+# Standardwert je Format: PNG-Kompressionsstufe 0-9, WebP-Qualität 1-100 (>100 = verlustfrei)
+DEFAULT_COMPRESSION = {'png': 3, 'webp': 90}
+
+
+# Hash über Datentyp, Form und Rohdaten: identische Bilder ergeben denselben Schlüssel
+def frame_hash(image_data):
+    image_data = np.ascontiguousarray(image_data)
+    digest = hashlib.sha256()
+    digest.update(f"{image_data.dtype.str}{image_data.shape}".encode())
+    digest.update(image_data.data)
+    return digest.hexdigest()
+
+
+# Rohbild in ein kodierbares Ganzzahlbild umwandeln (WebP nur 8 Bit, PNG auch 16 Bit)
+def _to_encodable(image_data, image_format):
+    if image_data.dtype == np.uint8 or (image_data.dtype == np.uint16 and image_format == 'png'):
+        return image_data
+    if image_format == 'png':
+        return cv2.normalize(image_data, None, 0, 65535, cv2.NORM_MINMAX).astype(np.uint16)
+    return cv2.normalize(image_data, None, 0, 255, cv2.NORM_MINMAX).astype(np.uint8)
+
+
+class ImageStore:
+    def __init__(self, root, image_format='png', compression=None, thumbnail_size=160, workers=2):
+        if image_format not in FORMATS:
+            raise ValueError(f"Unbekanntes Bildformat: {image_format}")
+        self.root = root
+        self.image_format = image_format
+        self.compression = compression if compression is not None else DEFAULT_COMPRESSION[image_format]
+        self.thumbnail_size = thumbnail_size
+        self.workers = workers
+        self._executor = None
+        self._pending = {}
+        self._lock = threading.Lock()
+
+    # Executor und Sperren nicht an Worker-Prozesse übertragen
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state.update(_executor=None, _pending={}, _lock=None)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    # Relativer Pfad (zum Speichern in der Datenbank) für Bild bzw. Vorschaubild
+    def relative_path(self, digest, thumbnail=False):
+        extension = FORMATS[self.image_format][0]
+        suffix = '_thumb' if thumbnail else ''
+        return os.path.join(digest[:2], digest[2:4], f"{digest}{suffix}{extension}")
+
+    def _write(self, relative_path, image):
+        extension, parameter = FORMATS[self.image_format]
+        ok, encoded = cv2.imencode(extension, image, [parameter, self.compression])
+        if not ok:
+            raise ValueError(f"Bild konnte nicht als {self.image_format} kodiert werden")
+        path = os.path.join(self.root, relative_path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Erst in eine temporäre Datei schreiben, dann atomar umbenennen
+        temporary_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(temporary_path, 'wb') as file:
+            file.write(encoded.tobytes())
+        os.replace(temporary_path, path)
+
+    # Bild synchron ablegen; bereits vorhandene Bilder werden nicht erneut kodiert.
+    # Rückgabe: (Hash, relativer Pfad)
+    def put(self, image_data):
+        digest = frame_hash(image_data)
+        relative_path = self.relative_path(digest)
+        if not os.path.exists(os.path.join(self.root, relative_path)):
+            image = _to_encodable(image_data, self.image_format)
+            self._write(self.relative_path(digest, thumbnail=True), self._thumbnail(image))
+            self._write(relative_path, image)
+        return digest, relative_path
+
+    def _thumbnail(self, image):
+        height, width = image.shape[:2]
+        scale = self.thumbnail_size / max(height, width)
+        if scale >= 1:
+            thumbnail = image
+        else:
+            thumbnail = cv2.resize(image, (max(1, round(width * scale)), max(1, round(height * scale))),
+                                   interpolation=cv2.INTER_AREA)
+        return _to_encodable(thumbnail, 'webp')
+
+    # Bild im Hintergrund ablegen; gleichzeitige Aufträge für dasselbe Bild teilen sich ein Future
+    def submit(self, image_data):
+        digest = frame_hash(image_data)
+        with self._lock:
+            future = self._pending.get(digest)
+            if future is not None:
+                return future
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='image-store')
+            future = self._executor.submit(self.put, image_data)
+            self._pending[digest] = future
+        future.add_done_callback(lambda _future: self._forget(digest))
+        return future
+
+    def _forget(self, digest):
+        with self._lock:
+            self._pending.pop(digest, None)
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+
+# Bildspeicher aus dem Abschnitt [image_store] der config.ini; None, wenn nicht konfiguriert
+def read_image_store_config(filename=CONFIG_FILE, section='image_store'):
+    parser = read_config(filename)
+    if not parser.has_section(section) or not parser.has_option(section, 'root'):
+        return None
+    return ImageStore(
+        root=parser.get(section, 'root'),
+        image_format=parser.get(section, 'format', fallback='png'),
+        compression=parser.getint(section, 'compression', fallback=None),
+        thumbnail_size=parser.getint(section, 'thumbnail_size', fallback=160),
+        workers=parser.getint(section, 'workers', fallback=2),
+    )
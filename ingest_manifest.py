@@ -0,0 +1,86 @@
+import os
+import sqlite3
+import threading
+import logging
+
+# Lokaler Zustandsspeicher (SQLite) für den inkrementellen Import.
+# Pro Datei werden Größe, mtime und der zuletzt verarbeitete Byte-Offset
+# gespeichert, damit unveränderte Dateien übersprungen und wachsende Dateien
+# ab dem neuen Ende gelesen werden können.
+
+DEFAULT_MANIFEST = 'ingest_manifest.sqlite'
+
+
+class IngestManifest:
+    def __init__(self, path=DEFAULT_MANIFEST):
+        self.path = path
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute("""
+            CREATE TABLE IF NOT EXISTS files (
+                path TEXT PRIMARY KEY,
+                size INTEGER NOT NULL,
+                mtime REAL NOT NULL,
+                byte_offset INTEGER NOT NULL,
+                updated_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+        self._connection.commit()
+
+    def get(self, file_path):
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT size, mtime, byte_offset FROM files WHERE path = ?", (file_path,)
+            ).fetchone()
+        return row
+
+    # Gibt (stat, start_offset) zurück oder None, wenn die Datei unverändert ist.
+    # Ist die Datei kleiner geworden (neu geschrieben), beginnt das Lesen wieder bei 0.
+    def pending(self, file_path):
+        stat = os.stat(file_path)
+        entry = self.get(file_path)
+        if entry is None:
+            return stat, 0
+
+        size, mtime, offset = entry
+        if stat.st_size == size and stat.st_mtime == mtime:
+            return None
+        if stat.st_size < offset:
+            logging.info(f"Datei {file_path} ist geschrumpft, wird vollständig neu eingelesen.")
+            return stat, 0
+        return stat, offset
+
+    def update(self, file_path, stat, offset):
+        with self._lock:
+            self._connection.execute("""
+                INSERT INTO files (path, size, mtime, byte_offset, updated_at)
+                VALUES (?, ?, ?, ?, CURRENT_TIMESTAMP)
+                ON CONFLICT(path) DO UPDATE SET
+                    size = excluded.size,
+                    mtime = excluded.mtime,
+                    byte_offset = excluded.byte_offset,
+                    updated_at = excluded.updated_at
+            """, (file_path, stat.st_size, stat.st_mtime, offset))
+            self._connection.commit()
+
+    def forget(self, file_path):
+        with self._lock:
+            self._connection.execute("DELETE FROM files WHERE path = ?", (file_path,))
+            self._connection.commit()
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+
+# Liest ab start_offset alle vollständigen Zeilen (mit Zeilenende) einer Datei.
+# Eine noch nicht abgeschlossene letzte Zeile bleibt für den nächsten Lauf stehen.
+# Rückgabe: (Liste der Zeilen, neuer Offset)
+def read_complete_lines(file_path, start_offset=0, encoding='utf-8'):
+    with open(file_path, 'rb') as file:
+        file.seek(start_offset)
+        data = file.read()
+
+    end = data.rfind(b'\n') + 1
+    lines = data[:end].decode(encoding, errors='replace').splitlines(keepends=True)
+    return lines, start_offset + end
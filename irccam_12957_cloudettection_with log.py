@@ -1,55 +1,32 @@
 import os
+import logging
 import cv2
-import numpy as np
 import mysql.connector
-from scipy.io import loadmat
 from datetime import datetime, timezone, timedelta
-from configparser import ConfigParser
 import re
 
-# Funktion zur Wolkenerkennung basierend auf einem Schwellenwert
-def detect_cloud_clusters(image_data):
-    gray_image = cv2.normalize(image_data, None, 0, 255, cv2.NORM_MINMAX).astype(np.uint8)
-    _, binary_image = cv2.threshold(gray_image, 200, 255, cv2.THRESH_BINARY)
-    contours, _ = cv2.findContours(binary_image, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-    
-    clusters = []
-    for contour in contours:
-        M = cv2.moments(contour)
-        if M['m00'] != 0:
-            cx = int(M['m10'] / M['m00'])
-            cy = int(M['m01'] / M['m00'])
-            clusters.append((cx, cy))
-    
-    return clusters
-
-# Funktion zur Berechnung der Sonnenposition
-def calculate_sun_position(timestamp, latitude, longitude, altitude=0):
-    from pysolar.solar import get_altitude, get_azimuth
-    elevation = get_altitude(latitude, longitude, timestamp)
-    azimuth = get_azimuth(latitude, longitude, timestamp)
-    return azimuth, elevation
+from cloud_detection import detect_cloud_metrics, calculate_sun_pixel, calculate_sun_position, read_min_cluster_area
+from image_store import read_image_store_config
+from solar_geometry import read_camera_config
+from database import acquire_connection
+from flag_rules import get_engine
+from irccam_reader import list_image_keys, load_image
+from metrics import count, export, stage
+from remote_cache import read_remote_cache_config
+from sky_mask import get_sky_mask, read_sky_mask_config
 
-# Datenbankverbindung herstellen
+# Datenbankverbindung aus dem gemeinsamen Pool holen (close() gibt sie zurück)
 def connect_to_database(config_file):
-    config = ConfigParser()
-    config.read(config_file)
-    
     try:
-        connection = mysql.connector.connect(
-            host=config.get('mysql', 'host'),
-            user=config.get('mysql', 'user'),
-            password=config.get('mysql', 'password'),
-            database=config.get('mysql', 'database')
-        )
-        return connection
+        return acquire_connection(config_file)
     except mysql.connector.Error as e:
         print(f"Fehler bei der Verbindung zur Datenbank: {e}")
         return None
 
 # Funktion zur Schlüsselsuche: höchsten gültigen Schlüssel finden
+# (akzeptiert geladene MAT-Daten oder eine Liste von Schlüsseln)
 def find_highest_key(mat_data):
-    available_keys = list(mat_data.keys())
+    available_keys = list(mat_data)
     print(f"Verfügbare Schlüssel: {available_keys}")
     
     # Extrahiere alle 'img_' Schlüssel und sortiere sie
@@ -67,12 +44,23 @@ def find_highest_key(mat_data):
 
 # Funktion zur Verarbeitung der Bilddaten
 def process_images(image_directory, latitude, longitude, config_file, delay_hours=40):
+    cache = read_remote_cache_config(config_file)
+
     # Suche nach der neuesten Datei
-    image_files = [f for f in os.listdir(image_directory) if f.endswith('.12957')]
-    latest_file = max(image_files, key=lambda f: os.path.getctime(os.path.join(image_directory, f)))
+    if cache is not None:
+        # Eine einzige Verzeichnisabfrage liefert Namen und Zeitstempel aller Dateien
+        listing = {name: stat for name, stat in cache.listdir(image_directory).items() if name.endswith('.12957')}
+        latest_file = max(listing, key=lambda f: listing[f].st_ctime)
+    else:
+        image_files = [f for f in os.listdir(image_directory) if f.endswith('.12957')]
+        latest_file = max(image_files, key=lambda f: os.path.getctime(os.path.join(image_directory, f)))
     file_path = os.path.join(image_directory, latest_file)
     
     print(f"Lade die neueste Datei: {file_path}")
+    if cache is not None:
+        # Lokale Kopie lesen (bei Wiederholungen ohne erneuten Netzwerkzugriff)
+        file_path = cache.fetch(file_path)
+        cache.close()
     
     try:
         # Extrahiere Datum und Uhrzeit aus dem Dateinamen (Dateiname: irccam_YYYYMMDDHHMM)
@@ -91,43 +79,74 @@ def process_images(image_directory, latitude, longitude, config_file, delay_hour
 
         print(f"Timestamp (mit Verzögerung) für Datei: {timestamp}")
 
-        # Lade die MAT-Datei
-        mat_data = loadmat(file_path)
+        # Nur den Schlüsselindex der MAT-Datei lesen
+        with stage('irccam.keys'):
+            available_keys = list_image_keys(file_path)
 
         # Höchsten Schlüssel finden
-        highest_key = find_highest_key(mat_data)
+        highest_key = find_highest_key(available_keys)
 
         if highest_key:
-            # Sicherstellen, dass der Schlüssel Bilddaten enthält
-            if 'image' in mat_data[highest_key].dtype.names:
-                image_data = mat_data[highest_key]['image'][0, 0]
-                clusters = detect_cloud_clusters(image_data)
-                azimuth, elevation = calculate_sun_position(timestamp, latitude, longitude)
+            # Nur die benötigte Bildvariable laden (None, wenn kein 'image'-Feld vorhanden ist)
+            with stage('irccam.load'):
+                image_data = load_image(file_path, highest_key)
+            if image_data is not None:
+                count('irccam_bytes_read', image_data.nbytes)
+                # Mit Bildspeicher wird parallel zur Wolkenerkennung im Hintergrund kodiert
+                image_store = read_image_store_config(config_file)
+                stored_image = image_store.submit(image_data) if image_store is not None else None
+
+                with stage('irccam.detect'):
+                    camera = read_camera_config(config_file)
+                    azimuth, elevation = calculate_sun_position(timestamp, latitude, longitude)
+                    sun_position = calculate_sun_pixel(azimuth, elevation, camera)
+                    # Optionale Himmelsmaske ([sky_mask] in config.ini), auf der Festplatte zwischengespeichert
+                    mask_settings = read_sky_mask_config(config_file)
+                    sky_mask = get_sky_mask(image_data.shape, camera, mask_settings) if mask_settings is not None else None
+                    metrics = detect_cloud_metrics(image_data, sun_position, sky_mask, read_min_cluster_area(config_file))
+                count('irccam_frames_processed')
+                cloud_flag = get_engine(config_file).point_flag('cloud', len(metrics['areas'])) != 'ok'
+                closest_distance = metrics['min_distance']
+                print(f"{len(metrics['areas'])} Wolkencluster, Bedeckungsgrad {metrics['cloud_cover']:.1%}")
                 
                 connection = connect_to_database(config_file)
                 if connection:
                     cursor = connection.cursor()
 
-                    closest_distance = None
-                    sun_position = (320, 240)  # Beispiel: Mittelpunkt des Bildes
-                    for cluster in clusters:
-                        distance = np.linalg.norm(np.array(cluster) - np.array(sun_position))
-                        if closest_distance is None or distance < closest_distance:
-                            closest_distance = distance
-
                     try:
-                        if image_data is not None:
+                        if stored_image is not None:
+                            image_hash, image_path = stored_image.result()
+                            sql = """
+                            INSERT IGNORE INTO ancillary.image_irccam (date_time, image_path, image_hash, sun_azimuth, sun_elevation, cloud_flag, cloud_distance)
+                            VALUES (%s, %s, %s, %s, %s, %s, %s)
+                            """
+                            with stage('irccam.insert'):
+                                cursor.execute(sql, (timestamp, image_path, image_hash, azimuth, elevation, cloud_flag, closest_distance))
+                                connection.commit()
+                            if cursor.rowcount:
+                                count('irccam_rows_inserted')
+                                print(f"Erfolgreich in die Datenbank eingefügt: {timestamp} ({image_path})")
+                            else:
+                                count('irccam_rows_skipped')
+                                print(f"Bereits in der Datenbank vorhanden: {timestamp}")
+                        elif image_data is not None:
                             _, img_encoded = cv2.imencode('.png', image_data)
                             if img_encoded is not None:
                                 image_blob = img_encoded.tobytes()
                                 
                                 sql = """
-                                INSERT INTO ancillary.image_irccam (date_time, image_data, sun_azimuth, sun_elevation, cloud_flag, cloud_distance)
+                                INSERT IGNORE INTO ancillary.image_irccam (date_time, image_data, sun_azimuth, sun_elevation, cloud_flag, cloud_distance)
                                 VALUES (%s, %s, %s, %s, %s, %s)
                                 """
-                                cursor.execute(sql, (timestamp, image_blob, azimuth, elevation, len(clusters) > 0, closest_distance))
-                                connection.commit()
-                                print(f"Erfolgreich in die Datenbank eingefügt: {timestamp}")
+                                with stage('irccam.insert'):
+                                    cursor.execute(sql, (timestamp, image_blob, azimuth, elevation, cloud_flag, closest_distance))
+                                    connection.commit()
+                                if cursor.rowcount:
+                                    count('irccam_rows_inserted')
+                                    print(f"Erfolgreich in die Datenbank eingefügt: {timestamp}")
+                                else:
+                                    count('irccam_rows_skipped')
+                                    print(f"Bereits in der Datenbank vorhanden: {timestamp}")
                             else:
                                 print("Fehler beim Kodieren des Bildes.")
                         else:
@@ -137,6 +156,9 @@ def process_images(image_directory, latitude, longitude, config_file, delay_hour
                     finally:
                         cursor.close()
                         connection.close()
+
+                if image_store is not None:
+                    image_store.close()
             else:
                 print(f"Kein 'image'-Feld im Schlüssel {highest_key} gefunden.")
         else:
@@ -146,6 +168,8 @@ def process_images(image_directory, latitude, longitude, config_file, delay_hour
 
 # Hauptprogramm
 if __name__ == "__main__":
+    # Messwerte am Ende als JSON-Logzeile ausgeben
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s:%(levelname)s:%(message)s')
     image_directory = r"\\ad.pmodwrc.ch\Institute\Projects\IRCCAM\IRCCAM_12957\data\2024"
     config_file = "config.ini"
     latitude = 46.813187
@@ -155,3 +179,4 @@ if __name__ == "__main__":
     delay_hours = 40
     
     process_images(image_directory, latitude, longitude, config_file, delay_hours)
+    export('irccam_cloud_detection')
@@ -0,0 +1,162 @@
+import argparse
+import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from functools import partial
+
+import cv2
+
+from cloud_detection import (MIN_CLUSTER_AREA, detect_cloud_metrics, calculate_sun_pixel, calculate_sun_position,
+                             read_min_cluster_area)
+from solar_geometry import DEFAULT_CAMERA, read_camera_config
+from database import get_connection
+from flag_rules import get_engine
+from image_store import read_image_store_config
+from irccam_index import DEFAULT_INDEX, FrameIndex
+from irccam_reader import load_image
+from metrics import collect, count, export, merge_collected, stage
+from sky_mask import get_sky_mask, read_sky_mask_config
+
+# Stapelverarbeitung der Wolkenerkennung: alle Bilder eines Zeitraums statt nur
+# des neuesten. Die OpenCV-Arbeit läuft in einem Prozesspool, die Ergebnisse
+# werden blockweise über eine einzige Datenbankverbindung eingefügt.
+
+IMAGE_DIRECTORY = r"\\ad.pmodwrc.ch\Institute\Projects\IRCCAM\IRCCAM_12957\data\2024"
+LATITUDE = 46.813187
+LONGITUDE = 9.84422
+
+# INSERT IGNORE: erneut verarbeitete Zeiträume oder Überschneidungen mit watch_daemon
+# legen keine doppelten Zeilen an. Setzt einen UNIQUE-Index auf date_time voraus:
+#   ALTER TABLE ancillary.image_irccam ADD UNIQUE KEY uq_date_time (date_time);
+INSERT_SQL = """
+INSERT IGNORE INTO ancillary.image_irccam (date_time, image_data, sun_azimuth, sun_elevation, cloud_flag, cloud_distance)
+VALUES (%s, %s, %s, %s, %s, %s)
+"""
+
+# Variante mit Bildspeicher: statt des PNG-BLOBs nur Pfad und Hash
+INSERT_SQL_IMAGE_STORE = """
+INSERT IGNORE INTO ancillary.image_irccam (date_time, image_path, image_hash, sun_azimuth, sun_elevation, cloud_flag, cloud_distance)
+VALUES (%s, %s, %s, %s, %s, %s, %s)
+"""
+
+
+# Ein einzelnes Bild auswerten; läuft im Worker-Prozess.
+# Mit mask_settings (siehe sky_mask.read_sky_mask_config) wird nur der Himmel ausgewertet.
+# Das Wolkenflag kommt aus den Punktregeln für 'cloud' (Wert = Anzahl Wolkencluster).
+# Gibt die Datenbankzeile zurück oder None, wenn das Bild nicht geladen werden konnte.
+def analyze_frame(frame, latitude=LATITUDE, longitude=LONGITUDE, camera=DEFAULT_CAMERA, image_store=None,
+                  mask_settings=None, flag_engine=None, min_area=MIN_CLUSTER_AREA):
+    timestamp, file_path, key = frame
+    try:
+        with stage('irccam.load'):
+            image_data = load_image(file_path, key)
+    except Exception as e:
+        logging.error(f"Fehler beim Laden von {key} aus {file_path}: {e}")
+        return None
+    if image_data is None:
+        return None
+    count('irccam_bytes_read', image_data.nbytes)
+
+    with stage('irccam.detect'):
+        # Die Maske wird pro Prozess und Bildgröße nur einmal geladen
+        sky_mask = get_sky_mask(image_data.shape, camera, mask_settings) if mask_settings is not None else None
+        azimuth, elevation = calculate_sun_position(timestamp.replace(tzinfo=timezone.utc), latitude, longitude)
+        metrics = detect_cloud_metrics(image_data, calculate_sun_pixel(azimuth, elevation, camera), sky_mask, min_area)
+    cloud_flag = (flag_engine or get_engine()).point_flag('cloud', len(metrics['areas'])) != 'ok'
+
+    if image_store is not None:
+        # Im Worker-Prozess ablegen; doppelte Bilder werden über den Hash erkannt
+        with stage('irccam.encode'):
+            image_hash, image_path = image_store.put(image_data)
+        return (timestamp, image_path, image_hash, azimuth, elevation, cloud_flag, metrics['min_distance'])
+
+    with stage('irccam.encode'):
+        _, img_encoded = cv2.imencode('.png', image_data)
+    if img_encoded is None:
+        logging.error(f"Fehler beim Kodieren des Bildes {key} aus {file_path}.")
+        return None
+
+    return (timestamp, img_encoded.tobytes(), azimuth, elevation, cloud_flag, metrics['min_distance'])
+
+
+# Alle übergebenen Bilder (Liste von (Zeitstempel, Datei, Schlüssel)) auswerten und speichern.
+# Gibt ein Dictionary mit Anzahl Bilder, eingefügten Zeilen und Bildern pro Sekunde zurück.
+def process_frames_batch(frames, config_file, latitude=LATITUDE, longitude=LONGITUDE,
+                         workers=None, chunk_size=64):
+    started = time.perf_counter()
+    image_store = read_image_store_config(config_file)
+    insert_sql = INSERT_SQL if image_store is None else INSERT_SQL_IMAGE_STORE
+    worker = partial(analyze_frame, latitude=latitude, longitude=longitude,
+                     camera=read_camera_config(config_file), image_store=image_store,
+                     mask_settings=read_sky_mask_config(config_file), flag_engine=get_engine(config_file),
+                     min_area=read_min_cluster_area(config_file))
+    # Messwerte der Worker-Prozesse werden mit jedem Ergebnis zurückgegeben
+    collecting_worker = partial(collect, os.getpid(), worker)
+    processed = 0
+    inserted = 0
+
+    with ProcessPoolExecutor(max_workers=workers) as executor, get_connection(config_file) as connection:
+        cursor = connection.cursor()
+        try:
+            # Blockweise verarbeiten, damit nie mehr als chunk_size kodierte Bilder im Speicher liegen
+            for start in range(0, len(frames), chunk_size):
+                chunk = frames[start:start + chunk_size]
+                results = [merge_collected(result) for result in executor.map(collecting_worker, chunk)]
+                rows = [row for row in results if row is not None]
+                processed += len(chunk)
+                count('irccam_frames_processed', len(chunk))
+                count('irccam_frames_failed', len(chunk) - len(rows))
+                if rows:
+                    with stage('irccam.insert'):
+                        cursor.executemany(insert_sql, rows)
+                        connection.commit()
+                    # Bei INSERT IGNORE zählt rowcount nur die tatsächlich eingefügten Zeilen
+                    inserted += cursor.rowcount
+                    count('irccam_rows_inserted', cursor.rowcount)
+                    count('irccam_rows_skipped', len(rows) - cursor.rowcount)
+                elapsed = time.perf_counter() - started
+                logging.info(f"{processed}/{len(frames)} Bilder verarbeitet ({processed / elapsed:.1f} Bilder/s).")
+        finally:
+            cursor.close()
+
+    elapsed = time.perf_counter() - started
+    frames_per_second = processed / elapsed if elapsed > 0 else 0.0
+    logging.info(f"{processed} Bilder in {elapsed:.1f} s verarbeitet ({frames_per_second:.1f} Bilder/s), {inserted} Zeilen eingefügt.")
+    return {'frames': processed, 'inserted': inserted, 'frames_per_second': frames_per_second}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Wolkenerkennung für alle IRCCAM-Bilder eines Zeitraums')
+    parser.add_argument('--start', required=True, type=datetime.fromisoformat, help='Beginn, z.B. 2024-08-01')
+    parser.add_argument('--end', required=True, type=datetime.fromisoformat, help='Ende, z.B. 2024-08-31T23:59')
+    parser.add_argument('--directory', action='append', help='IRCCAM-Datenverzeichnis (mehrfach möglich)')
+    parser.add_argument('--workers', type=int, default=None, help='Anzahl Worker-Prozesse (Standard: alle Kerne)')
+    parser.add_argument('--chunk-size', type=int, default=64, help='Bilder pro Datenbank-Block')
+    parser.add_argument('--index', default=DEFAULT_INDEX, help='SQLite-Datei des IRCCAM-Zeitindex')
+    parser.add_argument('--config', default='config.ini')
+    parser.add_argument('--metrics-file', default=None,
+                        help='Messwerte zusätzlich als Prometheus-Textdatei schreiben (z.B. irccam_batch.prom)')
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s:%(levelname)s:%(message)s')
+
+    index = FrameIndex(args.index)
+    try:
+        with stage('irccam.index'):
+            index.update(*(args.directory or [IMAGE_DIRECTORY]))
+        frames = index.range(args.start, args.end)
+    finally:
+        index.close()
+
+    if not frames:
+        logging.error(f"Keine Bilder zwischen {args.start} und {args.end} gefunden.")
+        return
+
+    logging.info(f"{len(frames)} Bilder zwischen {args.start} und {args.end} gefunden.")
+    process_frames_batch(frames, args.config, workers=args.workers, chunk_size=args.chunk_size)
+    export('irccam_batch', args.metrics_file)
+
+
+if __name__ == "__main__":
+    main()
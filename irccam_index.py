@@ -0,0 +1,163 @@
+import os
+import re
+import sqlite3
+import logging
+import threading
+from bisect import bisect_left, bisect_right
+from datetime import datetime, timedelta
+
+from irccam_reader import list_image_keys
+
+# Persistenter Zeitindex über das IRCCAM-Archiv: Zeitstempel -> (Datei, Schlüssel)
+# für jedes img_HHMMSS-Bild unter IRCCAM_12957/data/<Jahr>. Neue oder geänderte
+# Stundendateien werden inkrementell nachgetragen; Abfragen laufen per bisect
+# in O(log n) auf sortierten Listen im Speicher.
+
+DEFAULT_INDEX = 'irccam_index.sqlite'
+FILE_NAME_PATTERN = re.compile(r'irccam_(\d{12})\.12957$')
+
+
+# Beginn der Stundendatei aus dem Dateinamen (irccam_YYYYMMDDHHMM); None bei fremden Namen
+def file_timestamp(file_name):
+    match = FILE_NAME_PATTERN.search(file_name)
+    if not match:
+        return None
+    return datetime.strptime(match.group(1), '%Y%m%d%H%M')
+
+
+# Zeitstempel eines Bildes aus Dateiname (irccam_YYYYMMDDHHMM) und Schlüssel (img_HHMMSS)
+def frame_timestamp(file_name, key):
+    file_time = file_timestamp(file_name)
+    if file_time is None:
+        return None
+    key_time = datetime.strptime(key[4:10], '%H%M%S').time()
+    timestamp = datetime.combine(file_time.date(), key_time)
+    # Bilder kurz nach Mitternacht in der Datei der letzten Stunde des Vortags
+    if timestamp < file_time - timedelta(hours=12):
+        timestamp += timedelta(days=1)
+    return timestamp
+
+
+# Schlüssel einer Datei, dessen Zeit am nächsten an target_time liegt
+def nearest_key(file_name, keys, target_time):
+    timed_keys = [(frame_timestamp(file_name, key), key) for key in keys]
+    timed_keys = [(timestamp, key) for timestamp, key in timed_keys if timestamp is not None]
+    if not timed_keys:
+        return None
+    return min(timed_keys, key=lambda item: abs(item[0] - target_time))[1]
+
+
+class FrameIndex:
+    def __init__(self, path=DEFAULT_INDEX):
+        self.path = path
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.executescript("""
+            CREATE TABLE IF NOT EXISTS files (
+                path TEXT PRIMARY KEY,
+                mtime REAL NOT NULL,
+                size INTEGER NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS frames (
+                timestamp TEXT NOT NULL,
+                path TEXT NOT NULL,
+                key TEXT NOT NULL,
+                PRIMARY KEY (path, key)
+            );
+            CREATE INDEX IF NOT EXISTS frames_timestamp ON frames (timestamp);
+        """)
+        self._connection.commit()
+        self._load()
+
+    # Sortierte Listen aus der Datenbank in den Speicher laden
+    def _load(self):
+        rows = self._connection.execute(
+            "SELECT timestamp, path, key FROM frames ORDER BY timestamp, path, key"
+        ).fetchall()
+        self._timestamps = [datetime.fromisoformat(row[0]) for row in rows]
+        self._frames = [(row[1], row[2]) for row in rows]
+
+    def __len__(self):
+        return len(self._timestamps)
+
+    # Verzeichnisse einmal auflisten und nur neue, geänderte oder gelöschte Dateien nachführen.
+    # Gibt die Anzahl aktualisierter Dateien zurück.
+    def update(self, *directories):
+        with self._lock:
+            known = dict(
+                (row[0], (row[1], row[2]))
+                for row in self._connection.execute("SELECT path, mtime, size FROM files")
+            )
+            seen = set()
+            changed = 0
+
+            for directory in directories:
+                with os.scandir(directory) as entries:
+                    for entry in entries:
+                        if not entry.name.endswith('.12957') or not entry.is_file():
+                            continue
+                        stat = entry.stat()
+                        seen.add(entry.path)
+                        if known.get(entry.path) == (stat.st_mtime, stat.st_size):
+                            continue
+                        try:
+                            keys = list_image_keys(entry.path)
+                        except Exception as e:
+                            logging.error(f"Fehler beim Indizieren der Datei {entry.path}: {e}")
+                            continue
+                        self._replace_file(entry.path, stat, keys)
+                        changed += 1
+
+            scanned = tuple(os.path.normpath(directory) for directory in directories)
+            for path in known:
+                if path not in seen and os.path.dirname(os.path.normpath(path)) in scanned:
+                    self._connection.execute("DELETE FROM frames WHERE path = ?", (path,))
+                    self._connection.execute("DELETE FROM files WHERE path = ?", (path,))
+                    changed += 1
+
+            if changed:
+                self._connection.commit()
+                self._load()
+                logging.info(f"IRCCAM-Index: {changed} Dateien aktualisiert, {len(self)} Bilder indiziert.")
+            return changed
+
+    def _replace_file(self, path, stat, keys):
+        file_name = os.path.basename(path)
+        self._connection.execute("DELETE FROM frames WHERE path = ?", (path,))
+        rows = []
+        for key in keys:
+            timestamp = frame_timestamp(file_name, key)
+            if timestamp is not None:
+                rows.append((timestamp.isoformat(sep=' '), path, key))
+        self._connection.executemany("INSERT INTO frames (timestamp, path, key) VALUES (?, ?, ?)", rows)
+        self._connection.execute(
+            "INSERT OR REPLACE INTO files (path, mtime, size) VALUES (?, ?, ?)",
+            (path, stat.st_mtime, stat.st_size)
+        )
+
+    # Nächstgelegenes Bild zu timestamp als (Zeitstempel, Datei, Schlüssel) oder None,
+    # wenn kein Bild innerhalb von max_distance liegt
+    def nearest(self, timestamp, max_distance=None):
+        position = bisect_left(self._timestamps, timestamp)
+        candidates = [i for i in (position - 1, position) if 0 <= i < len(self._timestamps)]
+        if not candidates:
+            return None
+        best = min(candidates, key=lambda i: abs(self._timestamps[i] - timestamp))
+        if max_distance is not None and abs(self._timestamps[best] - timestamp) > max_distance:
+            return None
+        return (self._timestamps[best],) + self._frames[best]
+
+    # Alle Bilder mit start <= Zeitstempel <= end, zeitlich sortiert
+    def range(self, start, end):
+        lo = bisect_left(self._timestamps, start)
+        hi = bisect_right(self._timestamps, end)
+        return [(self._timestamps[i],) + self._frames[i] for i in range(lo, hi)]
+
+    def latest(self):
+        if not self._timestamps:
+            return None
+        return (self._timestamps[-1],) + self._frames[-1]
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
@@ -0,0 +1,59 @@
+import os
+import re
+from functools import lru_cache
+
+from scipy.io import loadmat, whosmat
+
+# Selektiver Leser für IRCCAM .12957 Dateien (MAT-Format).
+# Statt die ganze Stundendatei mit dutzenden img_HHMMSS-Strukturen zu laden,
+# wird ein Schlüsselindex aufgebaut (zwischengespeichert nach Pfad + mtime)
+# und nur die angeforderte Bildvariable dekodiert.
+
+IMAGE_KEY_PATTERN = re.compile(r'img_\d{6}$')
+
+# MATLAB v7.3 Dateien sind HDF5-Dateien mit 512 Byte Benutzerblock
+HDF5_SIGNATURE = b'\x89HDF\r\n\x1a\n'
+HDF5_SIGNATURE_OFFSET = 512
+
+
+def is_hdf5_mat(file_path):
+    with open(file_path, 'rb') as file:
+        file.seek(HDF5_SIGNATURE_OFFSET)
+        return file.read(len(HDF5_SIGNATURE)) == HDF5_SIGNATURE
+
+
+@lru_cache(maxsize=512)
+def _image_keys(file_path, mtime, size):
+    if is_hdf5_mat(file_path):
+        import h5py
+        with h5py.File(file_path, 'r') as mat_file:
+            names = list(mat_file.keys())
+    else:
+        # whosmat liest nur die Variablenköpfe, nicht die Bilddaten
+        names = [name for name, _shape, _class in whosmat(file_path)]
+    return tuple(sorted(name for name in names if IMAGE_KEY_PATTERN.match(name)))
+
+
+# Sortierte Liste aller img_HHMMSS-Schlüssel einer Datei
+def list_image_keys(file_path):
+    stat = os.stat(file_path)
+    return _image_keys(file_path, stat.st_mtime, stat.st_size)
+
+
+# Lädt nur das Feld 'image' der angegebenen Variable; None, wenn es nicht vorhanden ist
+def load_image(file_path, key):
+    if is_hdf5_mat(file_path):
+        import h5py
+        with h5py.File(file_path, 'r') as mat_file:
+            if key not in mat_file or 'image' not in mat_file[key]:
+                return None
+            # HDF5 speichert spaltenweise (MATLAB-Reihenfolge)
+            return mat_file[key]['image'][()].T
+
+    mat_data = loadmat(file_path, variable_names=[key])
+    if key not in mat_data:
+        return None
+    struct = mat_data[key]
+    if struct.dtype.names is None or 'image' not in struct.dtype.names:
+        return None
+    return struct['image'][0, 0]
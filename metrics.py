@@ -0,0 +1,155 @@
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+# Leichtgewichtige Messpunkte für die Ingest-Skripte.
+# Stufen (Lesen, Parsen, loadmat, OpenCV, Datenbank) werden per Kontextmanager
+# oder Dekorator gestoppt, Zähler (geparste, ungültige, doppelte, eingefügte und
+# übersprungene Zeilen, gelesene Bytes) pro Prozess aufsummiert. Am Ende eines
+# Laufs als JSON-Logzeile oder als Textdatei im Prometheus-Format ausgeben
+# (z.B. für den Textfile-Collector des node_exporter).
+
+PROMETHEUS_PREFIX = 'ancillary'
+
+# Pro-Zeilen-Debugausgaben nur für jede n-te Zeile
+TRACE_SAMPLE_EVERY = 100
+
+
+class Metrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters = {}
+        self.stages = {}  # Name -> [Aufrufe, Sekunden gesamt, Sekunden maximal]
+
+    def count(self, name, value=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def record(self, name, seconds, calls=1):
+        with self._lock:
+            stage = self.stages.setdefault(name, [0, 0.0, 0.0])
+            stage[0] += calls
+            stage[1] += seconds
+            stage[2] = max(stage[2], seconds)
+
+    # Kontextmanager: with stage('aod.parse'): ...
+    @contextmanager
+    def stage(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - started)
+
+    # Dekorator: @timed('wind.store')
+    def timed(self, name):
+        def decorator(function):
+            @wraps(function)
+            def wrapper(*args, **kwargs):
+                with self.stage(name):
+                    return function(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'counters': dict(self.counters),
+                'stages': {name: list(values) for name, values in self.stages.items()},
+            }
+
+    # Messwerte eines anderen Prozesses (siehe collect) übernehmen
+    def merge(self, snapshot):
+        for name, value in snapshot['counters'].items():
+            self.count(name, value)
+        with self._lock:
+            for name, (calls, seconds, maximum) in snapshot['stages'].items():
+                stage = self.stages.setdefault(name, [0, 0.0, 0.0])
+                stage[0] += calls
+                stage[1] += seconds
+                stage[2] = max(stage[2], maximum)
+
+    def reset(self):
+        with self._lock:
+            self.counters.clear()
+            self.stages.clear()
+
+    # Strukturierte Logzeile, z.B. {"script": "aod2", "counters": {...}, "stages": {...}}
+    def log_json(self, script, level=logging.INFO):
+        snapshot = self.snapshot()
+        document = {
+            'script': script,
+            'counters': snapshot['counters'],
+            'stages': {
+                name: {'calls': calls, 'seconds': round(seconds, 6), 'max_seconds': round(maximum, 6)}
+                for name, (calls, seconds, maximum) in snapshot['stages'].items()
+            },
+        }
+        logging.log(level, "metrics %s", json.dumps(document, sort_keys=True))
+
+    def to_prometheus(self, script, prefix=PROMETHEUS_PREFIX):
+        snapshot = self.snapshot()
+        label = f'script="{script}"'
+        lines = []
+        for name, value in sorted(snapshot['counters'].items()):
+            metric = f"{prefix}_{name}_total"
+            lines.append(f"# TYPE {metric} counter")
+            lines.append(f"{metric}{{{label}}} {value}")
+        if snapshot['stages']:
+            for suffix, index, kind in (('calls_total', 0, 'counter'), ('seconds_total', 1, 'counter'),
+                                        ('max_seconds', 2, 'gauge')):
+                metric = f"{prefix}_stage_{suffix}"
+                lines.append(f"# TYPE {metric} {kind}")
+                for name, values in sorted(snapshot['stages'].items()):
+                    lines.append(f'{metric}{{{label},stage="{name}"}} {values[index]}')
+        lines.append(f"# TYPE {prefix}_last_run_timestamp_seconds gauge")
+        lines.append(f"{prefix}_last_run_timestamp_seconds{{{label}}} {time.time():.0f}")
+        return '\n'.join(lines) + '\n'
+
+    # Atomar schreiben, damit der Collector nie eine halbe Datei liest
+    def write_prometheus(self, path, script, prefix=PROMETHEUS_PREFIX):
+        temporary_path = f"{path}.tmp"
+        with open(temporary_path, 'w') as file:
+            file.write(self.to_prometheus(script, prefix))
+        os.replace(temporary_path, path)
+
+
+# Gemeinsame Instanz pro Prozess
+METRICS = Metrics()
+count = METRICS.count
+stage = METRICS.stage
+timed = METRICS.timed
+
+
+# Für Prozesspools: führt function im Worker aus und gibt (Ergebnis, Messwerte) zurück.
+# Läuft die Funktion im aufrufenden Prozess (z.B. Thread-Pool), landen die Messwerte
+# ohnehin in METRICS und es wird None zurückgegeben.
+def collect(parent_pid, function, *args, **kwargs):
+    if os.getpid() == parent_pid:
+        return function(*args, **kwargs), None
+    METRICS.reset()
+    result = function(*args, **kwargs)
+    return result, METRICS.snapshot()
+
+
+def merge_collected(collected):
+    result, snapshot = collected
+    if snapshot is not None:
+        METRICS.merge(snapshot)
+    return result
+
+
+# Ob Debugausgaben überhaupt ausgegeben werden (einmal vor einer Schleife abfragen)
+def trace_enabled():
+    return logging.getLogger().isEnabledFor(logging.DEBUG)
+
+
+# Messwerte am Ende eines Laufs ausgeben: immer als JSON-Logzeile, optional als Prometheus-Datei
+def export(script, prometheus_file=None):
+    METRICS.log_json(script)
+    if prometheus_file:
+        METRICS.write_prometheus(prometheus_file, script)
@@ -0,0 +1,237 @@
+import argparse
+import logging
+import os
+import uuid
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+from database import cloud_row, get_connection, to_float
+from metrics import count, stage
+
+try:
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+# Spaltenorientiertes Archiv aller eingelesenen Messungen für Trendanalysen.
+# AOD-, Wind- und Wolkendatensätze werden nach Tag partitioniert als Parquet
+# abgelegt (<archiv>/<art>/date=YYYY-MM-DD/part-*.parquet), Flags und
+# Dateinamen dictionary-kodiert. Beim Lesen werden Zeitbereich und Flag als
+# Prädikate an pyarrow.dataset übergeben, sodass nur die betroffenen Tage und
+# Row-Groups gelesen werden. pyarrow ist optional und wird nur hier benötigt.
+
+DEFAULT_ARCHIVE = 'archive'
+COMPRESSION = 'zstd'
+
+
+def _schemas():
+    flag = pa.dictionary(pa.int8(), pa.string())
+    name = pa.dictionary(pa.int32(), pa.string())
+    timestamp = pa.timestamp('s')
+    return {
+        'aod': pa.schema([
+            ('date_time', timestamp), ('aod', pa.float64()), ('aod_flag', flag), ('filename', name),
+        ]),
+        'wind': pa.schema([
+            ('date_time', timestamp), ('windspeed', pa.float64()), ('winddirection', flag),
+            ('wind_flag', flag), ('filename', name),
+        ]),
+        'cloud': pa.schema([
+            ('date_time', timestamp), ('sun_azimuth', pa.float64()), ('sun_elevation', pa.float64()),
+            ('cloud_flag', flag), ('cloud_distance', pa.float64()),
+        ]),
+    }
+
+
+# Flag-Spalte je Art (für den flags-Filter beim Lesen)
+FLAG_COLUMNS = {'aod': 'aod_flag', 'wind': 'wind_flag', 'cloud': 'cloud_flag'}
+
+# Abfragen für den einmaligen Export aus der Datenbank (Spaltenreihenfolge wie im Schema)
+EXPORT_QUERIES = {
+    'aod': "SELECT date_time, aod, aod_flag, filename FROM aod_measurements "
+           "WHERE date_time >= %s AND date_time < %s ORDER BY date_time",
+    'wind': "SELECT date_time, windspeed, winddirection, wind_flag, filename FROM wind_measurements "
+            "WHERE date_time >= %s AND date_time < %s ORDER BY date_time",
+    'cloud': "SELECT date_time, sun_azimuth, sun_elevation, cloud_flag, cloud_distance FROM ancillary.image_irccam "
+             "WHERE date_time >= %s AND date_time < %s ORDER BY date_time",
+}
+
+
+def _require_pyarrow():
+    if pa is None:
+        raise ImportError("Für das Parquet-Archiv wird pyarrow benötigt (pip install pyarrow)")
+
+
+# Zeilen von ancillary.image_irccam bzw. analyze_frame in Wolkendatensätze umwandeln
+def cloud_records(rows):
+    return [cloud_row(row) for row in rows]
+
+
+# Zeilen aus aod_measurements bzw. wind_measurements: Messwert (zweite Spalte) als float
+def measurement_records(rows):
+    return [(row[0], to_float(row[1])) + tuple(row[2:]) for row in rows]
+
+
+def _partition_directory(root, kind, day):
+    return os.path.join(root, kind, f"date={day:%Y-%m-%d}")
+
+
+def _to_table(kind, records):
+    schema = _schemas()[kind]
+    columns = list(zip(*records)) if records else [[] for _ in schema]
+    return pa.Table.from_arrays(
+        [pa.array(column, type=field.type) for column, field in zip(columns, schema)], schema=schema
+    )
+
+
+# Tabelle atomar als neue Teildatei einer Partition schreiben
+def _write_part(directory, table):
+    os.makedirs(directory, exist_ok=True)
+    name = f"part-{uuid.uuid4().hex}.parquet"
+    # Mit Punkt beginnende Dateien werden von pyarrow.dataset ignoriert
+    temporary_path = os.path.join(directory, f".{name}.tmp")
+    pq.write_table(table, temporary_path, compression=COMPRESSION)
+    path = os.path.join(directory, name)
+    os.replace(temporary_path, path)
+    return path
+
+
+# Datensätze (Tupel wie von read_aod_data, read_wind_data bzw. cloud_records) ins Archiv
+# schreiben, eine neue Teildatei pro Tag. Gibt die Anzahl geschriebener Zeilen zurück.
+def write_records(kind, records, root=DEFAULT_ARCHIVE):
+    _require_pyarrow()
+    width = len(_schemas()[kind])
+    by_day = defaultdict(list)
+    for record in records:
+        by_day[record[0].date()].append(tuple(record[:width]))
+
+    written = 0
+    with stage('archive.write'):
+        for day, day_records in sorted(by_day.items()):
+            day_records.sort(key=lambda record: record[0])
+            _write_part(_partition_directory(root, kind, day), _to_table(kind, day_records))
+            written += len(day_records)
+    count('archive_rows_written', written)
+    logging.info(f"{written} {kind}-Datensätze in {len(by_day)} Tagespartitionen archiviert.")
+    return written
+
+
+# Alle Teildateien eines Tages zu einer einzigen, nach Zeit sortierten Datei
+# zusammenführen; doppelte Zeitstempel werden entfernt (der zuletzt geschriebene gewinnt)
+def compact_partition(kind, day, root=DEFAULT_ARCHIVE):
+    _require_pyarrow()
+    directory = _partition_directory(root, kind, day)
+    if not os.path.isdir(directory):
+        return 0
+    parts = sorted(
+        (os.path.join(directory, name) for name in os.listdir(directory) if name.startswith('part-')),
+        key=os.path.getmtime
+    )
+    if len(parts) <= 1:
+        return 0
+
+    rows = {}
+    for part in parts:
+        for record in pq.read_table(part).to_pylist():
+            rows[record['date_time']] = record
+    schema = _schemas()[kind]
+    records = [tuple(record[field.name] for field in schema) for _, record in sorted(rows.items())]
+    _write_part(directory, _to_table(kind, records))
+    for part in parts:
+        os.remove(part)
+    logging.info(f"{len(parts)} Teildateien von {kind} am {day} zu einer zusammengeführt ({len(records)} Zeilen).")
+    return len(parts)
+
+
+def compact(kind, root=DEFAULT_ARCHIVE):
+    directory = os.path.join(root, kind)
+    if not os.path.isdir(directory):
+        return 0
+    merged = 0
+    for name in sorted(os.listdir(directory)):
+        if name.startswith('date='):
+            merged += compact_partition(kind, datetime.strptime(name[5:], '%Y-%m-%d').date(), root)
+    return merged
+
+
+def open_dataset(kind, root=DEFAULT_ARCHIVE):
+    _require_pyarrow()
+    partitioning = ds.partitioning(pa.schema([('date', pa.string())]), flavor='hive')
+    return ds.dataset(os.path.join(root, kind), schema=_schemas()[kind].append(pa.field('date', pa.string())),
+                      format='parquet', partitioning=partitioning)
+
+
+# Archiv lesen; start/end (datetime, end exklusiv) und flags (z.B. ['flag', 'error'])
+# werden als Prädikate übergeben, sodass nicht betroffene Tagespartitionen gar nicht
+# geöffnet und Row-Groups über ihre Statistiken übersprungen werden.
+# Gibt eine pyarrow.Table zurück (z.B. .to_pandas() für die Analyse).
+def read_archive(kind, start=None, end=None, flags=None, columns=None, root=DEFAULT_ARCHIVE):
+    dataset = open_dataset(kind, root)
+    conditions = []
+    if start is not None:
+        conditions.append(ds.field('date') >= f"{start:%Y-%m-%d}")
+        conditions.append(ds.field('date_time') >= pa.scalar(start, pa.timestamp('s')))
+    if end is not None:
+        conditions.append(ds.field('date') <= f"{end:%Y-%m-%d}")
+        conditions.append(ds.field('date_time') < pa.scalar(end, pa.timestamp('s')))
+    if flags is not None:
+        conditions.append(ds.field(FLAG_COLUMNS[kind]).isin(list(flags)))
+
+    expression = None
+    for condition in conditions:
+        expression = condition if expression is None else expression & condition
+
+    with stage('archive.read'):
+        table = dataset.to_table(columns=columns or _schemas()[kind].names, filter=expression)
+    count('archive_rows_read', table.num_rows)
+    return table
+
+
+# Einmaliger Export eines Zeitraums aus der Datenbank, tageweise abgefragt
+def export_from_database(kind, start, end, config_file='config.ini', root=DEFAULT_ARCHIVE):
+    _require_pyarrow()
+    written = 0
+    day = start
+    with get_connection(config_file) as connection:
+        cursor = connection.cursor()
+        try:
+            while day < end:
+                next_day = min(day + timedelta(days=1), end)
+                cursor.execute(EXPORT_QUERIES[kind], (day, next_day))
+                rows = cursor.fetchall()
+                rows = cloud_records(rows) if kind == 'cloud' else measurement_records(rows)
+                written += write_records(kind, rows, root)
+                day = next_day
+        finally:
+            cursor.close()
+    return written
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Parquet-Archiv der AOD-, Wind- und Wolkendaten')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    export_parser = subparsers.add_parser('export', help='Zeitraum aus der Datenbank archivieren')
+    export_parser.add_argument('--kind', choices=sorted(EXPORT_QUERIES), action='append')
+    export_parser.add_argument('--start', required=True, type=datetime.fromisoformat, help='Beginn, z.B. 2024-08-01')
+    export_parser.add_argument('--end', required=True, type=datetime.fromisoformat, help='Ende (exklusiv), z.B. 2024-09-01')
+    export_parser.add_argument('--config', default='config.ini')
+
+    compact_parser = subparsers.add_parser('compact', help='Teildateien je Tag zusammenführen')
+    compact_parser.add_argument('--kind', choices=sorted(EXPORT_QUERIES), action='append')
+
+    for subparser in (export_parser, compact_parser):
+        subparser.add_argument('--archive', default=DEFAULT_ARCHIVE, help='Wurzelverzeichnis des Archivs')
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s:%(levelname)s:%(message)s')
+    for kind in args.kind or sorted(EXPORT_QUERIES):
+        if args.command == 'export':
+            export_from_database(kind, args.start, args.end, args.config, args.archive)
+        compact(kind, args.archive)
+
+
+if __name__ == "__main__":
+    main()
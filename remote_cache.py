@@ -0,0 +1,195 @@
+import hashlib
+import logging
+import os
+import shutil
+import sqlite3
+import threading
+import time
+
+from config import CONFIG_FILE, read_config
+from metrics import count
+
+# Lokaler Lese-Cache für die Dateien auf den UNC-Freigaben (\\ad.pmodwrc.ch\...).
+# Verzeichnislisten werden mit einem einzigen scandir geholt und für kurze Zeit
+# zwischengespeichert, sodass exists/stat/mtime-Abfragen nicht mehr einzeln über
+# SMB laufen. Dateien werden beim ersten Lesen lokal kopiert; der Schlüssel ist
+# Pfad + mtime + Größe, eine geänderte Datei bekommt also einen neuen Eintrag.
+# Der Cache ist in Größe und Alter begrenzt, verdrängt wird nach letztem Zugriff (LRU).
+
+DEFAULT_CACHE_DIRECTORY = 'remote_cache'
+DEFAULT_MAX_BYTES = 10 * 1024 ** 3
+DEFAULT_MAX_AGE = 7 * 24 * 3600
+DEFAULT_LISTING_TTL = 60.0
+INDEX_NAME = 'index.sqlite'
+
+
+def cache_key(remote_path, mtime, size):
+    return hashlib.sha1(f"{remote_path}|{mtime!r}|{size}".encode('utf-8')).hexdigest()
+
+
+class RemoteCache:
+    def __init__(self, directory=DEFAULT_CACHE_DIRECTORY, max_bytes=DEFAULT_MAX_BYTES,
+                 max_age=DEFAULT_MAX_AGE, listing_ttl=DEFAULT_LISTING_TTL):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.listing_ttl = listing_ttl
+        self._listings = {}  # Verzeichnis -> (Zeitpunkt, {Name: os.stat_result})
+        self._lock = threading.Lock()
+
+        os.makedirs(directory, exist_ok=True)
+        self._connection = sqlite3.connect(os.path.join(directory, INDEX_NAME), check_same_thread=False)
+        self._connection.execute("""
+            CREATE TABLE IF NOT EXISTS entries (
+                cache_key TEXT PRIMARY KEY,
+                remote_path TEXT NOT NULL,
+                local_path TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                last_access REAL NOT NULL
+            )
+        """)
+        self._connection.execute("CREATE INDEX IF NOT EXISTS ix_remote_path ON entries (remote_path)")
+        self._connection.execute("CREATE INDEX IF NOT EXISTS ix_last_access ON entries (last_access)")
+        self._connection.commit()
+
+    # Inhalt eines Verzeichnisses als {Name: os.stat_result}, ein scandir pro listing_ttl.
+    # Unter Windows liefert scandir Größe, mtime und ctime ohne zusätzliche Abfragen.
+    def listdir(self, directory, refresh=False):
+        now = time.monotonic()
+        cached = self._listings.get(directory)
+        if cached is not None and not refresh and now - cached[0] < self.listing_ttl:
+            return cached[1]
+
+        listing = {}
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                if entry.is_file():
+                    listing[entry.name] = entry.stat()
+        self._listings[directory] = (now, listing)
+        count('cache_listings')
+        return listing
+
+    # stat aus der zwischengespeicherten Verzeichnisliste; None, wenn die Datei nicht existiert
+    def stat(self, remote_path):
+        directory, name = os.path.split(remote_path)
+        try:
+            return self.listdir(directory).get(name)
+        except OSError:
+            try:
+                return os.stat(remote_path)
+            except FileNotFoundError:
+                return None
+
+    def exists(self, remote_path):
+        return self.stat(remote_path) is not None
+
+    # Lokalen Pfad einer entfernten Datei liefern und sie dafür bei Bedarf kopieren.
+    # Der lokale Dateiname entspricht dem entfernten (Dateinamen werden z.B. als
+    # filename-Spalte gespeichert oder für Zeitstempel ausgewertet).
+    def fetch(self, remote_path, stat=None):
+        stat = stat or self.stat(remote_path) or os.stat(remote_path)
+        key = cache_key(remote_path, stat.st_mtime, stat.st_size)
+        local_path = os.path.join(self.directory, key[:2], key, os.path.basename(remote_path))
+
+        with self._lock:
+            row = self._connection.execute("SELECT 1 FROM entries WHERE cache_key = ?", (key,)).fetchone()
+            if row is not None and os.path.exists(local_path):
+                self._connection.execute(
+                    "UPDATE entries SET last_access = ? WHERE cache_key = ?", (time.time(), key)
+                )
+                self._connection.commit()
+                count('cache_hits')
+                return local_path
+
+        count('cache_misses')
+        os.makedirs(os.path.dirname(local_path), exist_ok=True)
+        temporary_path = f"{local_path}.part"
+        shutil.copy2(remote_path, temporary_path)
+        size = os.path.getsize(temporary_path)
+        if size != stat.st_size:
+            # Datei wurde während des Kopierens geändert: nicht zwischenspeichern
+            logging.info(f"{remote_path} hat sich während des Kopierens geändert, wird direkt gelesen.")
+            os.remove(temporary_path)
+            return remote_path
+        os.replace(temporary_path, local_path)
+        count('cache_bytes_fetched', size)
+
+        with self._lock:
+            # Ältere Stände derselben Datei sind nicht mehr gültig
+            stale = self._connection.execute(
+                "SELECT cache_key, local_path FROM entries WHERE remote_path = ? AND cache_key != ?",
+                (remote_path, key)
+            ).fetchall()
+            self._remove(stale)
+            self._connection.execute(
+                "INSERT OR REPLACE INTO entries (cache_key, remote_path, local_path, size, last_access) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (key, remote_path, local_path, size, time.time())
+            )
+            self._connection.commit()
+        self.evict(keep=key)
+        return local_path
+
+    # Einträge älter als max_age entfernen, danach die am längsten nicht genutzten,
+    # bis die Gesamtgröße unter max_bytes liegt (der Eintrag keep bleibt erhalten)
+    def evict(self, keep=None):
+        with self._lock:
+            expired = self._connection.execute(
+                "SELECT cache_key, local_path FROM entries WHERE last_access < ?", (time.time() - self.max_age,)
+            ).fetchall()
+            self._remove(expired)
+
+            total = self._connection.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+            if total > self.max_bytes:
+                victims = []
+                for key, local_path, size in self._connection.execute(
+                        "SELECT cache_key, local_path, size FROM entries ORDER BY last_access"):
+                    if total <= self.max_bytes:
+                        break
+                    if key == keep:
+                        continue
+                    victims.append((key, local_path))
+                    total -= size
+                self._remove(victims)
+            self._connection.commit()
+
+    # Einträge und Dateien löschen (Aufrufer hält die Sperre)
+    def _remove(self, entries):
+        for key, local_path in entries:
+            try:
+                os.remove(local_path)
+                os.rmdir(os.path.dirname(local_path))
+            except OSError:
+                pass
+            self._connection.execute("DELETE FROM entries WHERE cache_key = ?", (key,))
+        count('cache_evictions', len(entries))
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+    # Für Prozesspools: im Worker wird der Index mit denselben Einstellungen neu geöffnet
+    def __getstate__(self):
+        return self.directory, self.max_bytes, self.max_age, self.listing_ttl
+
+    def __setstate__(self, state):
+        self.__init__(*state)
+
+
+# Cache aus config.ini lesen, z.B.
+#   [remote_cache]
+#   directory = D:\ancillary_cache
+#   max_size_mb = 20000
+#   max_age_days = 14
+#   listing_ttl = 60
+# Gibt None zurück, wenn kein Cache konfiguriert ist (direkter Zugriff auf die Freigaben).
+def read_remote_cache_config(filename=CONFIG_FILE, section='remote_cache'):
+    parser = read_config(filename)
+    if not parser.has_section(section) or not parser.has_option(section, 'directory'):
+        return None
+    return RemoteCache(
+        directory=parser.get(section, 'directory'),
+        max_bytes=parser.getint(section, 'max_size_mb', fallback=DEFAULT_MAX_BYTES // 1024 ** 2) * 1024 ** 2,
+        max_age=parser.getfloat(section, 'max_age_days', fallback=DEFAULT_MAX_AGE / 86400) * 86400,
+        listing_ttl=parser.getfloat(section, 'listing_ttl', fallback=DEFAULT_LISTING_TTL),
+    )
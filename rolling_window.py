@@ -0,0 +1,76 @@
+from collections import deque
+from datetime import timedelta
+
+# Gleitendes Zeitfenster über einen zeitlich sortierten Messwertstrom.
+# Summe, Anzahl und markierte Werte werden laufend nachgeführt, Minimum und
+# Maximum über monotone Deques; jede Aktualisierung kostet amortisiert O(1).
+
+
+class RollingWindow:
+    def __init__(self, minutes):
+        self.length = timedelta(minutes=minutes)
+        self._values = deque()
+        self._minimum = deque()
+        self._maximum = deque()
+        self._sum = 0.0
+        self._flagged = 0
+        self.latest = None
+
+    def __len__(self):
+        return len(self._values)
+
+    # Neuen Wert anhängen; Werte, die älter als der jüngste sind, werden ignoriert.
+    # Gibt False zurück, wenn der Wert verworfen wurde.
+    def add(self, timestamp, value, flagged=False):
+        if self.latest is not None and timestamp < self.latest:
+            return False
+        self.latest = timestamp
+        if value is not None:
+            self._values.append((timestamp, value, flagged))
+            self._sum += value
+            self._flagged += bool(flagged)
+            while self._minimum and self._minimum[-1][1] > value:
+                self._minimum.pop()
+            self._minimum.append((timestamp, value))
+            while self._maximum and self._maximum[-1][1] < value:
+                self._maximum.pop()
+            self._maximum.append((timestamp, value))
+        self.evict(timestamp)
+        return True
+
+    # Alle Werte entfernen, die vor (now - Fensterlänge) liegen
+    def evict(self, now):
+        cutoff = now - self.length
+        while self._values and self._values[0][0] <= cutoff:
+            _, value, flagged = self._values.popleft()
+            self._sum -= value
+            self._flagged -= bool(flagged)
+        while self._minimum and self._minimum[0][0] <= cutoff:
+            self._minimum.popleft()
+        while self._maximum and self._maximum[0][0] <= cutoff:
+            self._maximum.popleft()
+
+    @property
+    def mean(self):
+        return self._sum / len(self._values) if self._values else None
+
+    @property
+    def minimum(self):
+        return self._minimum[0][1] if self._minimum else None
+
+    @property
+    def maximum(self):
+        return self._maximum[0][1] if self._maximum else None
+
+    @property
+    def flagged(self):
+        return self._flagged
+
+    def stats(self):
+        return {
+            'count': len(self._values),
+            'mean': self.mean,
+            'min': self.minimum,
+            'max': self.maximum,
+            'flagged': self._flagged,
+        }
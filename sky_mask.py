@@ -0,0 +1,115 @@
+import hashlib
+import logging
+import os
+from collections import namedtuple
+from functools import lru_cache
+
+import cv2
+import numpy as np
+
+from config import CONFIG_FILE, read_config
+from solar_geometry import DEFAULT_CAMERA
+
+# Statische Himmelsmaske für die IRCCAM-Wolkenerkennung.
+# Pixel außerhalb des Fischaugen-Kreises, unterhalb einer Mindestelevation
+# (Horizonthindernisse) und im Bereich des Kameragehäuses werden ausgeblendet.
+# Die Maske hängt nur von Bildgröße, Kamerageometrie und Einstellungen ab; sie
+# wird einmal berechnet und als .npy-Datei zwischengespeichert.
+
+DEFAULT_MASK_DIRECTORY = 'sky_masks'
+DEFAULT_MIN_ELEVATION = 5.0   # Grad über dem Horizont
+DEFAULT_ROI_RADIUS = 80       # Pixel um die Sonne, die in voller Auflösung ausgewertet werden
+
+# Einstellungen aus config.ini (picklebar, wird an die Worker-Prozesse übergeben).
+#   obstruction_file: Graustufenbild oder .npy in Bildgröße, 0 = verdeckt (Gehäuse, Mast)
+#   coarse: Erkennung zuerst auf halber Auflösung, nur um die Sonne in voller Auflösung
+MaskSettings = namedtuple('MaskSettings', ['min_elevation', 'obstruction_file', 'directory', 'coarse', 'roi_radius'])
+DEFAULT_MASK_SETTINGS = MaskSettings(DEFAULT_MIN_ELEVATION, None, DEFAULT_MASK_DIRECTORY, False, DEFAULT_ROI_RADIUS)
+
+# Fertige Maske: mask ist uint8 (255 = Himmel), bounds das umschließende Rechteck
+# (x, y, Breite, Höhe) und pixels die Anzahl der Himmelspixel
+SkyMask = namedtuple('SkyMask', ['mask', 'bounds', 'pixels', 'coarse', 'roi_radius'])
+
+
+def _obstruction_mask(obstruction_file, shape):
+    if obstruction_file.endswith('.npy'):
+        obstruction = np.load(obstruction_file)
+    else:
+        obstruction = cv2.imread(obstruction_file, cv2.IMREAD_GRAYSCALE)
+        if obstruction is None:
+            raise ValueError(f"Maskendatei {obstruction_file} konnte nicht gelesen werden")
+    if obstruction.shape != shape:
+        obstruction = cv2.resize(obstruction, (shape[1], shape[0]), interpolation=cv2.INTER_NEAREST)
+    return obstruction > 0
+
+
+# Maske berechnen: Kreis bis zur Mindestelevation (äquidistante Projektion wie in
+# solar_geometry.sun_to_pixel), geschnitten mit der optionalen Gehäusemaske
+def build_sky_mask(shape, camera=DEFAULT_CAMERA, min_elevation=DEFAULT_MIN_ELEVATION, obstruction_file=None):
+    rows, columns = np.indices(shape[:2], dtype=np.float32)
+    radius = np.hypot(columns - camera.center_x, rows - camera.center_y)
+    sky = radius <= camera.radius * (90.0 - min_elevation) / 90.0
+    if obstruction_file:
+        sky &= _obstruction_mask(obstruction_file, shape[:2])
+    return sky.astype(np.uint8) * 255
+
+
+# Dateiname im Cache: Hash über alles, was die Maske beeinflusst
+def _mask_cache_path(shape, camera, settings):
+    parts = [repr(tuple(shape[:2])), repr(tuple(camera)), repr(settings.min_elevation)]
+    if settings.obstruction_file:
+        stat = os.stat(settings.obstruction_file)
+        parts += [os.path.abspath(settings.obstruction_file), repr(stat.st_mtime), str(stat.st_size)]
+    digest = hashlib.sha1('|'.join(parts).encode('utf-8')).hexdigest()
+    return os.path.join(settings.directory, f"sky_mask_{digest[:16]}.npy")
+
+
+# Maske für Bildgröße und Kamera holen: im Prozess zwischengespeichert, auf der
+# Festplatte als .npy, sonst neu berechnet
+@lru_cache(maxsize=8)
+def get_sky_mask(shape, camera=DEFAULT_CAMERA, settings=DEFAULT_MASK_SETTINGS):
+    shape = tuple(shape[:2])
+    path = _mask_cache_path(shape, camera, settings)
+    try:
+        mask = np.load(path)
+    except (OSError, ValueError):
+        mask = build_sky_mask(shape, camera, settings.min_elevation, settings.obstruction_file)
+        os.makedirs(settings.directory, exist_ok=True)
+        temporary_path = f"{path}.{os.getpid()}.tmp.npy"
+        np.save(temporary_path, mask)
+        os.replace(temporary_path, path)
+        logging.info(f"Himmelsmaske für {shape} berechnet und unter {path} gespeichert.")
+
+    bounds = cv2.boundingRect(mask)
+    return SkyMask(mask, bounds, int(np.count_nonzero(mask)), settings.coarse, settings.roi_radius)
+
+
+# Ausschnitt (x0, y0, x1, y1) um die Sonne, auf das Bild begrenzt
+def sun_roi(shape, sun_position, radius=DEFAULT_ROI_RADIUS):
+    height, width = shape[:2]
+    x0 = min(max(int(sun_position[0] - radius), 0), width)
+    y0 = min(max(int(sun_position[1] - radius), 0), height)
+    x1 = min(max(int(sun_position[0] + radius) + 1, 0), width)
+    y1 = min(max(int(sun_position[1] + radius) + 1, 0), height)
+    return x0, y0, x1, y1
+
+
+# Einstellungen aus dem Abschnitt [sky_mask] der config.ini, z.B.
+#   [sky_mask]
+#   min_elevation = 8
+#   obstruction_file = D:\irccam\housing_mask.png
+#   directory = sky_masks
+#   coarse = true
+#   roi_radius = 80
+# Gibt None zurück, wenn der Abschnitt fehlt (Erkennung auf dem ganzen Bild wie bisher).
+def read_sky_mask_config(filename=CONFIG_FILE, section='sky_mask'):
+    parser = read_config(filename)
+    if not parser.has_section(section):
+        return None
+    return MaskSettings(
+        min_elevation=parser.getfloat(section, 'min_elevation', fallback=DEFAULT_MIN_ELEVATION),
+        obstruction_file=parser.get(section, 'obstruction_file', fallback=None),
+        directory=parser.get(section, 'directory', fallback=DEFAULT_MASK_DIRECTORY),
+        coarse=parser.getboolean(section, 'coarse', fallback=False),
+        roi_radius=parser.getint(section, 'roi_radius', fallback=DEFAULT_ROI_RADIUS),
+    )
@@ -0,0 +1,151 @@
+from collections import namedtuple
+from datetime import datetime, timezone
+from functools import lru_cache
+
+import numpy as np
+
+from config import CONFIG_FILE, read_config
+
+# Vektorisierte Sonnengeometrie für den festen Standort Davos.
+# Azimut und Elevation werden nach den NOAA-Gleichungen (Meeus) für ganze
+# Arrays von Zeitstempeln in einem Aufruf berechnet; pro Tag wird zusätzlich
+# eine Minutentabelle zwischengespeichert. Die Ergebnisse lassen sich in
+# IRCCAM-Pixelkoordinaten umrechnen.
+
+SITE_LATITUDE = 46.813187
+SITE_LONGITUDE = 9.84422
+
+# Fischaugen-Geometrie der IRCCAM (äquidistante Projektion)
+CameraGeometry = namedtuple('CameraGeometry', ['center_x', 'center_y', 'radius', 'rotation', 'flip'])
+DEFAULT_CAMERA = CameraGeometry(center_x=320.0, center_y=240.0, radius=240.0, rotation=0.0, flip=False)
+
+
+# Kamerageometrie aus dem Abschnitt [irccam] der config.ini; fehlende Werte = Standard
+def read_camera_config(filename=CONFIG_FILE, section='irccam'):
+    parser = read_config(filename)
+    if not parser.has_section(section):
+        return DEFAULT_CAMERA
+    return CameraGeometry(
+        center_x=parser.getfloat(section, 'center_x', fallback=DEFAULT_CAMERA.center_x),
+        center_y=parser.getfloat(section, 'center_y', fallback=DEFAULT_CAMERA.center_y),
+        radius=parser.getfloat(section, 'radius', fallback=DEFAULT_CAMERA.radius),
+        rotation=parser.getfloat(section, 'rotation', fallback=DEFAULT_CAMERA.rotation),
+        flip=parser.getboolean(section, 'flip', fallback=DEFAULT_CAMERA.flip),
+    )
+
+
+# Zeitstempel (datetime, auch mit Zeitzone, oder datetime64) -> datetime64[ns] in UTC
+def _to_utc_datetime64(timestamps):
+    values = np.atleast_1d(np.asarray(timestamps, dtype=object))
+    if values.size and isinstance(values.flat[0], datetime):
+        values = np.array([
+            value.astimezone(timezone.utc).replace(tzinfo=None) if value.tzinfo else value
+            for value in values.flat
+        ], dtype='datetime64[ns]')
+    return values.astype('datetime64[ns]')
+
+
+# Azimut (Grad, von Nord über Ost) und Elevation (Grad, refraktionskorrigiert) für ein Array von Zeitstempeln
+def solar_position(timestamps, latitude=SITE_LATITUDE, longitude=SITE_LONGITUDE):
+    times = _to_utc_datetime64(timestamps)
+    seconds = (times - np.datetime64('1970-01-01T00:00:00', 'ns')) / np.timedelta64(1, 's')
+
+    julian_day = seconds / 86400.0 + 2440587.5
+    jc = (julian_day - 2451545.0) / 36525.0
+
+    mean_long = np.mod(280.46646 + jc * (36000.76983 + jc * 0.0003032), 360.0)
+    mean_anom = 357.52911 + jc * (35999.05029 - 0.0001537 * jc)
+    eccent = 0.016708634 - jc * (0.000042037 + 0.0000001267 * jc)
+    anom_rad = np.radians(mean_anom)
+    eq_center = (np.sin(anom_rad) * (1.914602 - jc * (0.004817 + 0.000014 * jc))
+                 + np.sin(2 * anom_rad) * (0.019993 - 0.000101 * jc)
+                 + np.sin(3 * anom_rad) * 0.000289)
+    omega = np.radians(125.04 - 1934.136 * jc)
+    app_long = mean_long + eq_center - 0.00569 - 0.00478 * np.sin(omega)
+    mean_obliq = 23.0 + (26.0 + (21.448 - jc * (46.815 + jc * (0.00059 - jc * 0.001813))) / 60.0) / 60.0
+    obliq = np.radians(mean_obliq + 0.00256 * np.cos(omega))
+    declination = np.arcsin(np.sin(obliq) * np.sin(np.radians(app_long)))
+
+    var_y = np.tan(obliq / 2.0) ** 2
+    long_rad = np.radians(mean_long)
+    eq_time = 4.0 * np.degrees(
+        var_y * np.sin(2 * long_rad)
+        - 2 * eccent * np.sin(anom_rad)
+        + 4 * eccent * var_y * np.sin(anom_rad) * np.cos(2 * long_rad)
+        - 0.5 * var_y ** 2 * np.sin(4 * long_rad)
+        - 1.25 * eccent ** 2 * np.sin(2 * anom_rad)
+    )
+
+    minutes_of_day = np.mod(seconds, 86400.0) / 60.0
+    true_solar_time = np.mod(minutes_of_day + eq_time + 4.0 * longitude, 1440.0)
+    hour_angle = np.radians(true_solar_time / 4.0 - 180.0)
+
+    lat = np.radians(latitude)
+    cos_zenith = np.clip(
+        np.sin(lat) * np.sin(declination) + np.cos(lat) * np.cos(declination) * np.cos(hour_angle), -1.0, 1.0
+    )
+    zenith = np.arccos(cos_zenith)
+    elevation = 90.0 - np.degrees(zenith)
+
+    azimuth = np.degrees(np.arctan2(
+        np.sin(hour_angle),
+        np.cos(hour_angle) * np.sin(lat) - np.tan(declination) * np.cos(lat)
+    )) + 180.0
+    azimuth = np.mod(azimuth, 360.0)
+
+    return azimuth, elevation + _refraction(elevation)
+
+
+# Atmosphärische Refraktion in Grad (NOAA-Näherung)
+def _refraction(elevation):
+    tan_e = np.tan(np.radians(np.clip(elevation, -0.575, 89.9)))
+    correction = np.where(
+        elevation > 5.0,
+        58.1 / tan_e - 0.07 / tan_e ** 3 + 0.000086 / tan_e ** 5,
+        np.where(
+            elevation > -0.575,
+            1735.0 + elevation * (-518.2 + elevation * (103.4 + elevation * (-12.79 + elevation * 0.711))),
+            -20.772 / tan_e
+        )
+    )
+    return np.where(elevation > 85.0, 0.0, correction / 3600.0)
+
+
+# Minutentabelle (1441 Einträge, 00:00 bis 24:00 UTC) für einen Tag, zwischengespeichert
+@lru_cache(maxsize=64)
+def day_table(day, latitude=SITE_LATITUDE, longitude=SITE_LONGITUDE):
+    minutes = np.datetime64(day, 'm') + np.arange(1441).astype('timedelta64[m]')
+    azimuth, elevation = solar_position(minutes, latitude, longitude)
+    # Azimut entfalten, damit die Interpolation über 360° hinweg stetig bleibt
+    azimuth = np.degrees(np.unwrap(np.radians(azimuth)))
+    azimuth.flags.writeable = False
+    elevation.flags.writeable = False
+    return azimuth, elevation
+
+
+# Sonnenstand aus den Minutentabellen (linear interpoliert), vektorisiert über beliebige Tage
+def cached_solar_position(timestamps, latitude=SITE_LATITUDE, longitude=SITE_LONGITUDE):
+    times = _to_utc_datetime64(timestamps)
+    days = times.astype('datetime64[D]')
+    minutes = (times - days) / np.timedelta64(1, 'm')
+
+    azimuth = np.empty(len(times))
+    elevation = np.empty(len(times))
+    grid = np.arange(1441)
+    for day in np.unique(days):
+        mask = days == day
+        table_azimuth, table_elevation = day_table(day.item(), latitude, longitude)
+        azimuth[mask] = np.interp(minutes[mask], grid, table_azimuth)
+        elevation[mask] = np.interp(minutes[mask], grid, table_elevation)
+
+    return np.mod(azimuth, 360.0), elevation
+
+
+# Azimut/Elevation -> Pixelkoordinaten (x, y) im IRCCAM-Bild (äquidistantes Fischauge, Zenit in der Mitte)
+def sun_to_pixel(azimuth, elevation, camera=DEFAULT_CAMERA):
+    radius = camera.radius * (90.0 - np.asarray(elevation, dtype=float)) / 90.0
+    angle = np.radians(np.asarray(azimuth, dtype=float) + camera.rotation)
+    direction = -1.0 if camera.flip else 1.0
+    x = camera.center_x + direction * radius * np.sin(angle)
+    y = camera.center_y - radius * np.cos(angle)
+    return x, y
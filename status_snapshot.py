@@ -0,0 +1,200 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from database import cloud_row, get_connection, to_float
+from rolling_window import RollingWindow
+
+# Vorab aggregierter "aktueller Kalibrierzustand" für index.html.
+# Die Ingest-Pipeline meldet jede eingefügte Messung; pro Sensor werden der
+# letzte Wert, das Flag und gleitende 10/30/60-Minuten-Statistiken nachgeführt.
+# Das Ergebnis liegt als fertiges JSON-Dokument mit ETag im Speicher (und in
+# status.json), sodass die Seite unabhängig von der Tabellengröße lädt.
+
+DEFAULT_STATUS_FILE = 'status.json'
+WINDOWS = (10, 30, 60)
+SENSORS = ('aod', 'wind', 'cloud')
+
+# Startwerte aus der Datenbank: die letzten 60 Minuten je Tabelle (eine Bereichsabfrage)
+SEED_QUERIES = {
+    'aod': """
+        SELECT date_time, aod, aod_flag FROM aod_measurements
+        WHERE date_time >= (SELECT MAX(date_time) FROM aod_measurements) - INTERVAL 60 MINUTE
+        ORDER BY date_time
+    """,
+    'wind': """
+        SELECT date_time, windspeed, wind_flag, winddirection FROM wind_measurements
+        WHERE date_time >= (SELECT MAX(date_time) FROM wind_measurements) - INTERVAL 60 MINUTE
+        ORDER BY date_time
+    """,
+    'cloud': """
+        SELECT date_time, cloud_distance, cloud_flag FROM ancillary.image_irccam
+        WHERE date_time >= (SELECT MAX(date_time) FROM ancillary.image_irccam) - INTERVAL 60 MINUTE
+        ORDER BY date_time
+    """,
+}
+
+
+# Umwandlung der Datensätze der Ingest-Skripte in (Zeitstempel, Wert, Flag, Zusatzfelder)
+def aod_points(aod_data):
+    return [(date_time, aod, aod_flag, {}) for date_time, aod, aod_flag, _filename in aod_data]
+
+
+def wind_points(wind_data):
+    return [
+        (date_time, windspeed, wind_flag, {'winddirection': winddirection})
+        for date_time, windspeed, winddirection, wind_flag, _filename in wind_data
+    ]
+
+
+# Zeilen für ancillary.image_irccam (mit BLOB oder Bildspeicher), siehe database.cloud_row
+def cloud_points(rows):
+    points = []
+    for row in rows:
+        timestamp, azimuth, elevation, cloud_flag, cloud_distance = cloud_row(row)
+        extra = {'sun_azimuth': azimuth, 'sun_elevation': elevation, 'clouds': cloud_flag != 'ok'}
+        points.append((timestamp, cloud_distance, cloud_flag, extra))
+    return points
+
+
+class StatusSnapshot:
+    def __init__(self, path=DEFAULT_STATUS_FILE, windows=WINDOWS):
+        self.path = path
+        self._lock = threading.Lock()
+        self._latest = {sensor: None for sensor in SENSORS}
+        self._windows = {sensor: {minutes: RollingWindow(minutes) for minutes in windows} for sensor in SENSORS}
+        self._render()
+
+    # Neue Messpunkte eines Sensors einarbeiten (zeitlich sortiert, siehe *_points)
+    def update(self, sensor, points):
+        if not points:
+            return
+        with self._lock:
+            for timestamp, value, flag, extra in points:
+                latest = self._latest[sensor]
+                if latest is None or timestamp >= latest['date_time']:
+                    self._latest[sensor] = dict(extra, date_time=timestamp, value=value, flag=flag)
+                for window in self._windows[sensor].values():
+                    window.add(timestamp, value, flag != 'ok')
+            self._render()
+        self._write()
+
+    # Snapshot aus den letzten 60 Minuten der Datenbank vorbelegen (einmal beim Start)
+    def seed_from_database(self, config_file='config.ini'):
+        with get_connection(config_file) as connection:
+            cursor = connection.cursor()
+            try:
+                for sensor, query in SEED_QUERIES.items():
+                    cursor.execute(query)
+                    rows = cursor.fetchall()
+                    if sensor == 'wind':
+                        points = [(row[0], to_float(row[1]), row[2], {'winddirection': row[3]}) for row in rows]
+                    elif sensor == 'cloud':
+                        points = [(row[0], to_float(row[1]), 'flag' if row[2] else 'ok', {'clouds': bool(row[2])})
+                                  for row in rows]
+                    else:
+                        points = [(row[0], to_float(row[1]), row[2], {}) for row in rows]
+                    self.update(sensor, points)
+            finally:
+                cursor.close()
+
+    def _render(self):
+        document = {
+            'generated_at': datetime.now().isoformat(timespec='seconds'),
+            'sensors': {
+                sensor: {
+                    'latest': self._latest[sensor],
+                    'windows': {f"{minutes}min": window.stats() for minutes, window in self._windows[sensor].items()},
+                }
+                for sensor in SENSORS
+            },
+        }
+        self._body = json.dumps(document, default=_json_default, indent=1).encode('utf-8')
+        self._etag = '"' + hashlib.sha1(self._body).hexdigest() + '"'
+
+    # Dokument atomar in die Statusdatei schreiben (für einen statischen Webserver)
+    def _write(self):
+        if not self.path:
+            return
+        body, _ = self.document()
+        temporary_path = f"{self.path}.tmp"
+        with open(temporary_path, 'wb') as file:
+            file.write(body)
+        os.replace(temporary_path, self.path)
+
+    # Gibt (JSON-Bytes, ETag) zurück
+    def document(self):
+        with self._lock:
+            return self._body, self._etag
+
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat(sep=' ')
+    if hasattr(value, 'item'):
+        return value.item()  # NumPy-Skalare
+    raise TypeError(f"{type(value).__name__} ist nicht JSON-serialisierbar")
+
+
+# HTTP-Handler: liefert /status.json aus dem Speicher (mit ETag/304) und index.html.
+# Nur diese beiden Pfade sind freigegeben; im Skriptverzeichnis liegen auch
+# config.ini (Datenbankpasswort), Manifest und Logdateien.
+class StatusRequestHandler(BaseHTTPRequestHandler):
+    snapshot = None
+    directory = '.'
+    static_files = {'/': 'index.html', '/index.html': 'index.html'}
+
+    def do_GET(self):
+        path = self.path.split('?', 1)[0]
+        if path == '/status.json':
+            return self._send_status()
+        if path in self.static_files:
+            return self._send_file(self.static_files[path], 'text/html; charset=utf-8')
+        self.send_error(404)
+
+    def _send_file(self, name, content_type):
+        try:
+            with open(os.path.join(self.directory, name), 'rb') as file:
+                body = file.read()
+        except OSError:
+            return self.send_error(404)
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_status(self):
+        body, etag = self.snapshot.document()
+        if self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.end_headers()
+            return
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('ETag', etag)
+        self.send_header('Cache-Control', 'no-cache')
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logging.debug(f"HTTP {self.address_string()}: {format % args}")
+
+
+# HTTP-Server in einem Hintergrund-Thread starten; gibt den Server zurück (shutdown() zum Beenden).
+# Standardmäßig nur lokal erreichbar; für andere Rechner host='0.0.0.0' setzen.
+def serve_status(snapshot, host='127.0.0.1', port=8080, directory='.'):
+    handler = type('BoundStatusRequestHandler', (StatusRequestHandler,),
+                   {'snapshot': snapshot, 'directory': directory})
+    server = ThreadingHTTPServer((host, port), handler)
+    thread = threading.Thread(target=server.serve_forever, name='status-http', daemon=True)
+    thread.start()
+    logging.info(f"Statusseite unter http://{host}:{port}/ verfügbar.")
+    return server
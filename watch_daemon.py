@@ -0,0 +1,260 @@
+import argparse
+import asyncio
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime, timedelta
+from functools import partial
+
+import aod2
+import wind_data
+from cloud_detection import read_min_cluster_area
+from database import get_connection
+from flag_rules import get_engine
+from image_store import read_image_store_config
+from ingest_manifest import DEFAULT_MANIFEST, IngestManifest
+from irccam_batch import INSERT_SQL, INSERT_SQL_IMAGE_STORE, analyze_frame
+from irccam_index import file_timestamp, frame_timestamp
+from irccam_reader import list_image_keys
+from sky_mask import read_sky_mask_config
+from solar_geometry import read_camera_config
+from status_snapshot import DEFAULT_STATUS_FILE, StatusSnapshot, aod_points, cloud_points, serve_status, wind_points
+
+try:
+    from watchfiles import awatch
+except ImportError:
+    awatch = None
+
+# Dauerhaft laufender Dienst, der die Einmal-Skripte (Cron) ersetzt.
+# Die AOD-, WIND- und IRCCAM-Verzeichnisse werden überwacht (Polling, oder
+# watchfiles/inotify wo verfügbar); nur neue oder geänderte Dateien gehen an die
+# bestehenden Parse-/Erkennungs-/Speicherfunktionen. Prozesspool, Datenbankpool
+# und Importe bleiben zwischen den Durchläufen warm.
+
+AOD_DIRECTORY = r'\\ad.pmodwrc.ch\Institute\Departments\WRC\SRS\ancillary_data\AOD\2024'
+WIND_FILE = r'\\ad.pmodwrc.ch\Institute\Departments\WRC\SRS\ancillary_data\WIND\CR7X1.DAT'
+IRCCAM_DIRECTORY = r"\\ad.pmodwrc.ch\Institute\Projects\IRCCAM\IRCCAM_12957\data\2024"
+
+
+# Verzeichnis in einem Durchgang auflisten: {Pfad: (Größe, mtime)}
+def scan_directory(directory, predicate):
+    snapshot = {}
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            if predicate(entry.name) and entry.is_file():
+                stat = entry.stat()
+                snapshot[entry.path] = (stat.st_size, stat.st_mtime)
+    return snapshot
+
+
+def is_aod_file(since, name):
+    if not (name.startswith('DAV_N01_') and name.endswith('.003')):
+        return False
+    try:
+        return datetime.strptime(name.split('_')[2].split('.')[0], '%Y%m%d').date() >= since
+    except ValueError:
+        return False
+
+
+# Datum aus dem Dateinamen, damit ältere Stundendateien gar nicht erst geöffnet werden.
+# Die 23-Uhr-Datei des Vortags kann noch Bilder kurz nach Mitternacht enthalten.
+def is_irccam_file(since, name):
+    file_time = file_timestamp(name)
+    if file_time is None:
+        return False
+    return (file_time + timedelta(hours=1)).date() >= since
+
+
+class WatchService:
+    def __init__(self, config_file='config.ini', manifest_path=DEFAULT_MANIFEST, workers=None,
+                 poll_interval=10.0, since=None, use_inotify=True, status_file=DEFAULT_STATUS_FILE):
+        self.config_file = config_file
+        self.poll_interval = poll_interval
+        self.since = since or datetime.now().date() - timedelta(days=1)
+        self.use_inotify = use_inotify and awatch is not None
+        self.manifest = IngestManifest(manifest_path)
+        self.camera = read_camera_config(config_file)
+        self.image_store = read_image_store_config(config_file)
+        self.mask_settings = read_sky_mask_config(config_file)
+        self.min_cluster_area = read_min_cluster_area(config_file)
+        # Gleitende Fenster der Flag-Regeln bleiben über alle Durchläufe erhalten
+        self.flag_engine = get_engine(config_file)
+        self.flag_stream = self.flag_engine.stream()
+        self.snapshot = StatusSnapshot(status_file)
+        # Parsen und OpenCV in Prozessen, Datenbankschreiben über einen einzigen Thread
+        self.process_pool = ProcessPoolExecutor(max_workers=workers)
+        self.writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix='db-writer')
+
+    async def _run(self, executor, function, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(executor, partial(function, *args, **kwargs))
+
+    # Erzeugt Listen geänderter Dateien: zuerst ein vollständiger Abgleich, danach
+    # Ereignisse von watchfiles bzw. Polling im festen Intervall
+    async def _changes(self, directory, predicate):
+        previous = {}
+        use_inotify = self.use_inotify
+        while True:
+            try:
+                snapshot = await self._run(None, scan_directory, directory, predicate)
+            except OSError as e:
+                logging.error(f"Verzeichnis {directory} nicht lesbar: {e}")
+                snapshot = previous
+            changed = sorted(path for path, state in snapshot.items() if previous.get(path) != state)
+            previous = snapshot
+            if changed:
+                yield changed
+
+            if use_inotify:
+                try:
+                    async for events in awatch(directory):
+                        paths = sorted({path for _, path in events if predicate(os.path.basename(path))})
+                        if paths:
+                            yield paths
+                except Exception as e:
+                    # z.B. Freigabe getrennt: für dieses Verzeichnis mit Polling weitermachen
+                    logging.warning(f"Dateiüberwachung für {directory} abgebrochen ({e}), wechsle auf Polling.")
+                    use_inotify = False
+            await asyncio.sleep(self.poll_interval)
+
+    async def watch(self, name, directory, predicate, handler):
+        logging.info(f"Überwache {name}: {directory}")
+        async for paths in self._changes(directory, predicate):
+            for path in paths:
+                try:
+                    await handler(path)
+                except Exception:
+                    logging.exception(f"Fehler bei der Verarbeitung von {path}")
+
+    async def handle_aod(self, path):
+        state = self.manifest.pending(path)
+        if state is None:
+            return
+        stat, offset = state
+        aod_data, end_offset = await self._run(self.process_pool, aod2.read_aod_data_incremental, path, offset,
+                                               config_file=self.config_file)
+        if self.flag_engine.has_window_rules('aod'):
+            aod_data = self.flag_stream.flag_records('aod', aod_data, 1, 2)
+        await self._run(self.writer, aod2.store_to_database_bulk, aod_data, config_file=self.config_file)
+        self.manifest.update(path, stat, end_offset)
+        self.snapshot.update('aod', aod_points(aod_data))
+
+    async def handle_wind(self, path):
+        state = self.manifest.pending(path)
+        if state is None:
+            return
+        stat, offset = state
+        records, end_offset = await self._run(
+            self.process_pool, wind_data.read_wind_data_incremental, path, offset, self.since,
+            config_file=self.config_file
+        )
+        if self.flag_engine.has_window_rules('wind'):
+            records = self.flag_stream.flag_records('wind', records, 1, 3)
+        await self._run(self.writer, wind_data.store_to_database_bulk, records, config_file=self.config_file)
+        self.manifest.update(path, stat, end_offset)
+        self.snapshot.update('wind', wind_points(records))
+
+    # Bei IRCCAM-Dateien speichert das Manifest statt eines Byte-Offsets die Sekunden ab
+    # Beginn der Stundendatei bis hinter das letzte verarbeitete Bild. Neue Bilder werden
+    # über ihren Zeitstempel gewählt, nicht über ihre Position: list_image_keys sortiert
+    # nach Namen, Bilder nach Mitternacht (img_00xxxx) stehen dort also vor img_23xxxx.
+    async def handle_irccam(self, path):
+        state = self.manifest.pending(path)
+        if state is None:
+            return
+        stat, processed_until = state
+        keys = await self._run(None, list_image_keys, path)
+        name = os.path.basename(path)
+        file_time = file_timestamp(name)
+        if file_time is None:
+            return
+        frames = [(frame_timestamp(name, key), path, key) for key in keys]
+        frames = [frame for frame in frames if (frame[0] - file_time).total_seconds() >= processed_until]
+        if frames:
+            processed_until = int((max(frame[0] for frame in frames) - file_time).total_seconds()) + 1
+        frames = [frame for frame in frames if frame[0].date() >= self.since]
+
+        worker = partial(analyze_frame, camera=self.camera, image_store=self.image_store,
+                         mask_settings=self.mask_settings, flag_engine=self.flag_engine,
+                         min_area=self.min_cluster_area)
+        loop = asyncio.get_running_loop()
+        rows = await asyncio.gather(*(loop.run_in_executor(self.process_pool, worker, frame) for frame in frames))
+        rows = [row for row in rows if row is not None]
+        if rows:
+            inserted = await self._run(self.writer, self._insert_frames, rows)
+            self.snapshot.update('cloud', cloud_points(rows))
+            logging.info(f"{inserted} von {len(rows)} IRCCAM-Bildern aus {name} gespeichert.")
+        self.manifest.update(path, stat, processed_until)
+
+    def _insert_frames(self, rows):
+        insert_sql = INSERT_SQL if self.image_store is None else INSERT_SQL_IMAGE_STORE
+        with get_connection(self.config_file) as connection:
+            cursor = connection.cursor()
+            try:
+                cursor.executemany(insert_sql, rows)
+                connection.commit()
+                # Bei INSERT IGNORE nur die tatsächlich eingefügten Zeilen
+                return cursor.rowcount
+            finally:
+                cursor.close()
+
+    async def run(self, aod_directory=AOD_DIRECTORY, wind_file=WIND_FILE, irccam_directory=IRCCAM_DIRECTORY):
+        wind_name = os.path.basename(wind_file)
+        await asyncio.gather(
+            self.watch('AOD', aod_directory, partial(is_aod_file, self.since), self.handle_aod),
+            self.watch('WIND', os.path.dirname(wind_file), lambda name: name == wind_name, self.handle_wind),
+            self.watch('IRCCAM', irccam_directory, partial(is_irccam_file, self.since), self.handle_irccam),
+        )
+
+    def close(self):
+        self.process_pool.shutdown(wait=True)
+        self.writer.shutdown(wait=True)
+        if self.image_store is not None:
+            self.image_store.close()
+        self.manifest.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Dienst für AOD-, Wind- und IRCCAM-Daten')
+    parser.add_argument('--config', default='config.ini')
+    parser.add_argument('--manifest', default=DEFAULT_MANIFEST)
+    parser.add_argument('--workers', type=int, default=None, help='Worker-Prozesse (Standard: alle Kerne)')
+    parser.add_argument('--poll-interval', type=float, default=10.0, help='Sekunden zwischen zwei Verzeichnisabgleichen')
+    parser.add_argument('--since', type=lambda value: datetime.strptime(value, '%Y-%m-%d').date(),
+                        help='Nur Daten ab diesem Datum verarbeiten (Standard: gestern)')
+    parser.add_argument('--no-inotify', action='store_true', help='Immer Polling statt watchfiles verwenden')
+    parser.add_argument('--status-file', default=DEFAULT_STATUS_FILE, help='Pfad der status.json für index.html')
+    parser.add_argument('--http-port', type=int, default=0,
+                        help='index.html und /status.json auf diesem Port ausliefern (0 = aus)')
+    parser.add_argument('--http-host', default='127.0.0.1',
+                        help='Adresse für --http-port (0.0.0.0 = von anderen Rechnern erreichbar)')
+    parser.add_argument('--log-file', default=None, help='Protokoll in diese Datei statt auf die Konsole schreiben')
+    parser.add_argument('--log-level', default='INFO', choices=['DEBUG', 'INFO', 'WARNING', 'ERROR'])
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(filename=args.log_file, level=args.log_level,
+                        format='%(asctime)s:%(levelname)s:%(message)s')
+
+    service = WatchService(args.config, args.manifest, args.workers, args.poll_interval,
+                           args.since, use_inotify=not args.no_inotify, status_file=args.status_file)
+    try:
+        service.snapshot.seed_from_database(args.config)
+    except Exception as e:
+        logging.warning(f"Status konnte nicht aus der Datenbank vorbelegt werden: {e}")
+
+    server = None
+    if args.http_port:
+        server = serve_status(service.snapshot, host=args.http_host, port=args.http_port,
+                              directory=os.path.dirname(os.path.abspath(__file__)))
+    try:
+        asyncio.run(service.run())
+    except KeyboardInterrupt:
+        logging.info("Dienst beendet.")
+    finally:
+        if server is not None:
+            server.shutdown()
+        service.close()
+
+
+if __name__ == "__main__":
+    main()
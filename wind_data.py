@@ -1,88 +1,212 @@
-import mysql.connector
-import configparser
 from datetime import datetime, timedelta
 import os
 import logging
+import argparse
+from collections import namedtuple
+from functools import lru_cache
 
-# Protokollierung einrichten
-logging.basicConfig(filename='wind_data.log', level=logging.INFO, 
-                    format='%(asctime)s:%(levelname)s:%(message)s')
-
-# Funktion zum Lesen der Konfigurationsdatei
-def read_db_config(filename='config.ini', section='mysql'):
-    parser = configparser.ConfigParser()
-    parser.read(filename)
-    
-    db = {}
-    if parser.has_section(section):
-        items = parser.items(section)
-        for item in items:
-            db[item[0]] = item[1]
+from database import CONFIG_FILE, transaction
+from flag_rules import get_engine
+from ingest_manifest import DEFAULT_MANIFEST, IngestManifest, read_complete_lines
+from metrics import count, export, stage, timed
+
+WIND_MIN_FIELDS = 27
+DEFAULT_BATCH_SIZE = 1000
+
+# Typisierter Datensatz; als Tupel mit den Spalten der Tabelle wind_measurements verwendbar
+WindRecord = namedtuple('WindRecord', ['date_time', 'windspeed', 'winddirection', 'wind_flag', 'filename'])
+
+# Umrechnung Jahr + Julianischer Tag -> Datum, zwischengespeichert (nur wenige Tage pro Datei)
+@lru_cache(maxsize=4096)
+def julian_to_date(year, julian_day):
+    return datetime.strptime(f"{year}{julian_day:03d}", '%Y%j').date()
+
+# Datum einer Zeile bestimmen, ohne die ganze Zeile zu zerlegen (None bei Kopf-/Fehlzeilen)
+def line_date(line):
+    parts = line.split(',', 3)
+    if len(parts) < 4:
+        return None
+    try:
+        return julian_to_date(int(parts[1]), int(parts[2]))
+    except ValueError:
+        return None
+
+# Funktion zum Auswerten einer einzelnen Zeile.
+# Gibt den Datensatz zurück oder None, wenn die Zeile außerhalb des Datumsfensters liegt.
+# Das Flag kommt aus den Regeln in config.ini; mit stream auch aus den gleitenden Fenstern.
+def parse_wind_line(parts, date, filename, stream=None):
+    # Annahme: Spalte 4 ist die Zeit als HHMM ab 00:00
+    time_in_minutes = int(parts[3])
+
+    # Berechnung der Zeit aus Minuten
+    if time_in_minutes < 100:
+        hours = 0
+        minutes = time_in_minutes
     else:
-        raise Exception(f'{section} not found in the {filename} file')
-    
-    return db
+        hours = time_in_minutes // 100
+        minutes = time_in_minutes % 100
+    datetime_value = datetime.combine(date, datetime.min.time()) + timedelta(hours=hours, minutes=minutes)
+
+    windspeed = float(parts[23].strip())  # Spalte 24 (Index 23) ist Windgeschwindigkeit in m/s
+    winddirection_degrees = float(parts[26].strip())  # Spalte 27 (Index 26) ist Windrichtung in Grad
+
+    if stream is not None:
+        wind_flag = stream.flag('wind', datetime_value, windspeed)
+    else:
+        wind_flag = get_engine().point_flag('wind', windspeed)
+
+    winddirection = convert_wind_direction(winddirection_degrees)
+
+    return WindRecord(datetime_value, windspeed, winddirection, wind_flag, filename)
 
-# Funktion zum Einlesen der Daten
-def read_wind_data(file_path):
+# Erzeugt (Zeilennummer, Datum, Teile) für alle Zeilen im Datumsfenster [start_date, end_date].
+# Da die Logger-Datei zeitlich sortiert ist, wird nach dem Fensterende abgebrochen.
+def _iter_window_lines(lines, start_date, end_date, first_line_number, stop_after_end):
+    for line_number, line in enumerate(lines, start=first_line_number):
+        parts = line.split(',')
+        if len(parts) < WIND_MIN_FIELDS:
+            if len(parts) > 1:
+                logging.warning("Zeile %s: Zu wenige Teile (%s)", line_number, len(parts))
+                count('wind_rows_invalid')
+            continue
+
+        # Ausgabe der ersten paar Zeilen zur Überprüfung des Formats
+        if line_number <= 10:
+            logging.debug("Zeile %s: %s", line_number, parts)
+
+        try:
+            # Annahme: Spalte 2 ist das Jahr, Spalte 3 ist der Julianische Tag
+            date = julian_to_date(int(parts[1]), int(parts[2]))
+        except Exception as e:
+            logging.error(f"Fehler in Zeile {line_number}: {e}")
+            count('wind_rows_invalid')
+            continue
+
+        if start_date is not None and date < start_date:
+            continue
+        if end_date is not None and date > end_date:
+            if stop_after_end:
+                break
+            continue
+
+        yield line_number, date, parts
+
+# Funktion zum Auswerten der Zeilen der Logger-Datei
+def parse_wind_lines(lines, start_date, end_date, filename, first_line_number=1, stream=None):
     wind_data = []
-    current_date = datetime.now().date()  # Das aktuelle Datum
-
-    with open(file_path, 'r') as file:
-        for line_number, line in enumerate(file, start=1):
-            parts = line.split(',')
-            if len(parts) < 27:
-                if len(parts) > 1:
-                    logging.warning(f"Zeile {line_number}: Zu wenige Teile ({len(parts)})")
-                continue
+    stream = stream or get_engine().stream()
+
+    for line_number, date, parts in _iter_window_lines(lines, start_date, end_date, first_line_number, False):
+        try:
+            wind_data.append(parse_wind_line(parts, date, filename, stream))
+        except Exception as e:
+            logging.error(f"Fehler in Zeile {line_number}: {e}")
+            count('wind_rows_invalid')
+
+    count('wind_rows_parsed', len(wind_data))
+    return wind_data
+
+# Binäre Suche nach dem Byte-Offset der ersten Zeile mit Datum >= start_date.
+# Setzt eine zeitlich sortierte Logger-Datei voraus; file muss binär geöffnet sein.
+def find_date_offset(file, start_date):
+    file.seek(0, os.SEEK_END)
+    lo, hi = 0, file.tell()
+
+    # Offset des ersten Zeilenanfangs >= position und Datum der ersten gültigen Zeile ab dort
+    def probe(position):
+        if position > 0:
+            file.seek(position - 1)
+            file.readline()
+        else:
+            file.seek(0)
+        line_start = file.tell()
+        for raw in file:
+            date = line_date(raw.decode('utf-8', errors='replace'))
+            if date is not None:
+                return line_start, date
+        return line_start, None
 
+    while lo < hi:
+        mid = (lo + hi) // 2
+        _, date = probe(mid)
+        if date is None or date >= start_date:
+            hi = mid
+        else:
+            lo = mid + 1
+
+    return probe(lo)[0]
+
+# Streaming-Leser: liefert die Datensätze im Datumsfenster als Blöcke von WindRecords.
+# Der Speicherbedarf hängt nur von batch_size ab, nicht von der Größe der Logger-Datei.
+def iter_wind_data(file_path, start_date=None, end_date=None, batch_size=DEFAULT_BATCH_SIZE):
+    filename = os.path.basename(file_path)
+    stream = get_engine().stream()
+
+    with open(file_path, 'rb') as file:
+        with stage('wind.seek'):
+            offset = find_date_offset(file, start_date) if start_date is not None else 0
+        file.seek(offset)
+        lines = (raw.decode('utf-8', errors='replace') for raw in file)
+        # Zeilennummern sind bei einem Sprung in die Datei relativ zum Startpunkt
+        batch = []
+        for line_number, date, parts in _iter_window_lines(lines, start_date, end_date, 1, True):
             try:
-                # Annahme: Spalte 2 ist das Jahr, Spalte 3 ist der Julianische Tag, Spalte 4 ist die Zeit in Minuten ab 00:00
-                year = int(parts[1])
-                julian_day = int(parts[2])
-                time_in_minutes = int(parts[3])
-                
-                # Erstelle das Datum aus Jahr und Julianischem Tag
-                day = f"{year}{julian_day:03d}"
-                date = datetime.strptime(day, '%Y%j').date()
-                
-                if date != current_date:
-                    continue  # Überspringe Daten, die nicht vom aktuellen Tag sind
-
-                # Berechnung der Zeit aus Minuten
-                if time_in_minutes < 100:
-                    hours = 0
-                    minutes = time_in_minutes
-                else:
-                    hours = time_in_minutes // 100
-                    minutes = time_in_minutes % 100
-                datetime_value = datetime.combine(date, datetime.min.time()) + timedelta(hours=hours, minutes=minutes)
-
-                windspeed = float(parts[23].strip())  # Spalte 24 (Index 23) ist Windgeschwindigkeit in m/s
-                winddirection_degrees = float(parts[26].strip())  # Spalte 27 (Index 26) ist Windrichtung in Grad
-
-                if windspeed < 0.0 or windspeed is None:
-                    wind_flag = 'error'
-                elif windspeed < 2.5:
-                    wind_flag = 'ok'
-                else:
-                    wind_flag = 'flag'
-
-                winddirection = convert_wind_direction(winddirection_degrees)
-
-                filename = os.path.basename(file_path)
-
-                wind_data.append((datetime_value, windspeed, winddirection, wind_flag, filename))
+                batch.append(parse_wind_line(parts, date, filename, stream))
             except Exception as e:
                 logging.error(f"Fehler in Zeile {line_number}: {e}")
+                count('wind_rows_invalid')
+                continue
+            if len(batch) >= batch_size:
+                count('wind_rows_parsed', len(batch))
+                yield batch
+                batch = []
+        if batch:
+            count('wind_rows_parsed', len(batch))
+            yield batch
+        count('wind_bytes_read', file.tell() - offset)
+
+# Funktion zum Einlesen der Daten (Standard: nur der aktuelle Tag)
+@timed('wind.read')
+def read_wind_data(file_path, start_date=None, end_date=None):
+    if start_date is None:
+        start_date = datetime.now().date()  # Das aktuelle Datum
+    if end_date is None:
+        end_date = start_date
 
-            # Ausgabe der ersten paar Zeilen zur Überprüfung des Formats
-            if line_number <= 10:
-                logging.info(f"Zeile {line_number}: {parts}")
+    wind_data = []
+    for batch in iter_wind_data(file_path, start_date, end_date):
+        wind_data.extend(batch)
 
     logging.info(f"{len(wind_data)} gültige Datensätze gefunden.")
     return wind_data
 
+# Funktion zum inkrementellen Einlesen ab einem Byte-Offset (z.B. aus dem Ingest-Manifest).
+# Das Datumsfenster (Standard: ab dem aktuellen Tag, end_date=None ohne Obergrenze) gilt
+# nur beim ersten Lauf (Offset 0), bei dem per binärer Suche zum start_date gesprungen wird.
+# Ab einem gespeicherten Offset werden alle vollständigen Zeilen übernommen, sonst gingen
+# z.B. nach Mitternacht angehängte Zeilen des Vortags verloren.
+# Die Flag-Regeln kommen aus config_file.
+# Gibt (wind_data, neuer Offset) zurück; Zeilennummern in Fehlermeldungen zählen ab dem Offset.
+def read_wind_data_incremental(file_path, start_offset=0, start_date=None, end_date=None, config_file=CONFIG_FILE):
+    filename = os.path.basename(file_path)
+
+    if start_offset == 0:
+        if start_date is None:
+            start_date = datetime.now().date()
+        with stage('wind.seek'), open(file_path, 'rb') as file:
+            start_offset = find_date_offset(file, start_date)
+    else:
+        start_date = end_date = None
+
+    with stage('wind.read'):
+        lines, end_offset = read_complete_lines(file_path, start_offset)
+    count('wind_bytes_read', end_offset - start_offset)
+    with stage('wind.parse'):
+        wind_data = parse_wind_lines(lines, start_date, end_date, filename, stream=get_engine(config_file).stream())
+
+    logging.info(f"{len(wind_data)} neue Datensätze ab Byte {start_offset} gefunden.")
+    return wind_data, end_offset
+
 # Funktion zum Umrechnen der Windrichtung in Himmelsrichtungen
 def convert_wind_direction(degrees):
     directions = ["N", "NNE", "NE", "ENE", "E", "ESE", "SE", "SSE", "S", "SSW", "SW", "WSW", "W", "WNW", "NW", "NNW"]
@@ -90,45 +214,92 @@ def convert_wind_direction(degrees):
     return directions[idx]
 
 # Funktion zum Speichern der Daten in die Datenbank
-def store_to_database(wind_data):
-    # Lese die Konfigurationsdatei
-    db_config = read_db_config()
-    
-    # Verbinde mit der MySQL-Datenbank
-    db = mysql.connector.connect(
-        host=db_config['host'],
-        user=db_config['user'],
-        password=db_config['password'],
-        database=db_config['database']
-    )
-    cursor = db.cursor()
+@timed('wind.store')
+def store_to_database(wind_data, config_file=CONFIG_FILE):
+    inserted = 0
 
+    # Verbindung aus dem gemeinsamen Pool, Bestätigung am Ende der Transaktion
+    with transaction(config_file) as tx:
+        for data in wind_data:
+            datetime_value, windspeed, winddirection, wind_flag, filename = data
+
+            # Prüfen, ob der Datensatz bereits vorhanden ist
+            cursor = tx.execute("SELECT COUNT(*) FROM wind_measurements WHERE date_time = %s", (datetime_value,))
+            existing = cursor.fetchone()[0]
+            
+            if existing == 0:
+                query = """
+                INSERT INTO wind_measurements (date_time, windspeed, winddirection, wind_flag, filename)
+                VALUES (%s, %s, %s, %s, %s)
+                """
+                tx.execute(query, data)
+                inserted += 1
+
+    skipped = len(wind_data) - inserted
+    count('wind_rows_inserted', inserted)
+    count('wind_rows_skipped', skipped)
+    logging.info(f"{inserted} Datensätze wurden in die Datenbank eingefügt, {skipped} übersprungen.")
+    return inserted, skipped
+
+# Funktion zum gebündelten Speichern der Daten in die Datenbank.
+# Setzt einen UNIQUE-Index auf date_time voraus:
+#   ALTER TABLE wind_measurements ADD UNIQUE KEY uq_date_time (date_time);
+@timed('wind.store')
+def store_to_database_bulk(wind_data, chunk_size=1000, config_file=CONFIG_FILE):
+    # Doppelte Zeitstempel entfernen (erster Eintrag gewinnt)
+    unique_rows = {}
     for data in wind_data:
-        datetime_value, windspeed, winddirection, wind_flag, filename = data
-
-        # Prüfen, ob der Datensatz bereits vorhanden ist
-        cursor.execute("SELECT COUNT(*) FROM wind_measurements WHERE date_time = %s", (datetime_value,))
-        count = cursor.fetchone()[0]
-        
-        if count == 0:
-            query = """
-            INSERT INTO wind_measurements (date_time, windspeed, winddirection, wind_flag, filename)
-            VALUES (%s, %s, %s, %s, %s)
-            """
-            cursor.execute(query, data)
-
-    # Bestätige die Transaktion und schließe die Verbindung
-    db.commit()
-    cursor.close()
-    db.close()
-
-    logging.info(f"{len(wind_data)} Datensätze wurden in die Datenbank eingefügt.")
-
-def main():
+        unique_rows.setdefault(data[0], data)
+    rows = list(unique_rows.values())
+
+    with transaction(config_file) as tx:
+        inserted = tx.insert_ignore_many(
+            'wind_measurements', ('date_time', 'windspeed', 'winddirection', 'wind_flag', 'filename'), rows, chunk_size
+        )
+
+    skipped = len(wind_data) - inserted
+    count('wind_rows_deduplicated', len(wind_data) - len(rows))
+    count('wind_rows_inserted', inserted)
+    count('wind_rows_skipped', len(rows) - inserted)
+    logging.info(f"{inserted} Datensätze wurden in die Datenbank eingefügt, {skipped} übersprungen.")
+    return inserted, skipped
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Winddaten in die Datenbank einlesen')
+    parser.add_argument('--manifest', default=DEFAULT_MANIFEST,
+                        help='SQLite-Datei mit dem Stand des inkrementellen Imports')
+    parser.add_argument('--full', action='store_true',
+                        help='Manifest ignorieren und die ganze Datei einlesen')
+    parser.add_argument('--metrics-file', default=None,
+                        help='Messwerte zusätzlich als Prometheus-Textdatei schreiben (z.B. wind_data.prom)')
+    args = parser.parse_args(argv)
+
+    # Protokollierung einrichten (nur beim Aufruf als Skript, nicht beim Import)
+    logging.basicConfig(filename='wind_data.log', level=logging.INFO, 
+                        format='%(asctime)s:%(levelname)s:%(message)s')
+
     file_path = r'\\ad.pmodwrc.ch\Institute\Departments\WRC\SRS\ancillary_data\WIND\CR7X1.DAT'
-    
-    wind_data = read_wind_data(file_path)
-    store_to_database(wind_data)
+
+    if args.full:
+        wind_data = read_wind_data(file_path)
+        store_to_database_bulk(wind_data)
+        export('wind_data', args.metrics_file)
+        return
+
+    # Nur den seit dem letzten Lauf angehängten Teil der Logger-Datei lesen
+    manifest = IngestManifest(args.manifest)
+    try:
+        state = manifest.pending(file_path)
+        if state is None:
+            logging.info(f"Datei unverändert, übersprungen: {file_path}")
+            return
+        stat, offset = state
+        wind_data, end_offset = read_wind_data_incremental(file_path, offset)
+        store_to_database_bulk(wind_data)
+        manifest.update(file_path, stat, end_offset)
+    finally:
+        manifest.close()
+        export('wind_data', args.metrics_file)
 
 if __name__ == "__main__":
     main()